@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from models.user import User
+
+# ── Config ────────────────────────────────────────────────────────────────────
+# Rates are requests per minute; 0 disables the limit for that class of caller.
+ANON_RATE_PER_MIN  = float(os.getenv("ADMISSION_ANON_RATE_PER_MIN", "30"))
+ANON_BURST         = int(os.getenv("ADMISSION_ANON_BURST", "10"))
+USER_RATE_PER_MIN  = float(os.getenv("ADMISSION_USER_RATE_PER_MIN", "120"))
+USER_BURST         = int(os.getenv("ADMISSION_USER_BURST", "20"))
+INFERENCE_SLOTS    = int(os.getenv("ADMISSION_INFERENCE_SLOTS", "1"))
+MAX_QUEUE_WAIT_S   = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT_S", "10"))
+MAX_QUEUE_LENGTH   = int(os.getenv("ADMISSION_MAX_QUEUE_LENGTH", "100"))
+
+PRIORITY_USER = 0       # lower value is served first
+PRIORITY_ANON = 1
+
+router = APIRouter(prefix="/admission", tags=["admission"])
+
+
+# ── Token buckets ─────────────────────────────────────────────────────────────
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, burst: int):
+        self.rate    = rate_per_sec
+        self.burst   = burst
+        self.tokens  = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume one token; returns 0 on success, else seconds until one is free."""
+        now          = time.monotonic()
+        self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Per-key token buckets; keys are "user:<id>" or "ip:<address>"."""
+
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self.buckets: dict = {}
+
+    def check(self, key: str, rate_per_min: float, burst: int) -> float:
+        if rate_per_min <= 0:
+            return 0.0
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_BUCKETS:
+                self._prune()
+            bucket = self.buckets[key] = TokenBucket(rate_per_min / 60.0, max(burst, 1))
+        return bucket.take()
+
+    def _prune(self):
+        # Buckets idle long enough to have refilled completely carry no state
+        now = time.monotonic()
+        for key, b in list(self.buckets.items()):
+            if b.tokens + (now - b.updated) * b.rate >= b.burst:
+                del self.buckets[key]
+
+
+# ── Priority scheduler ────────────────────────────────────────────────────────
+class Shed(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason      = reason
+        self.retry_after = retry_after
+
+
+class InferenceScheduler:
+    """Bounded number of concurrent inferences with a priority wait queue.
+
+    Waiters are (priority, arrival) ordered, so authenticated users always
+    overtake anonymous ones and each class is FIFO. A waiter that cannot get a
+    slot within max_wait is shed rather than left to pile up.
+    """
+
+    def __init__(self, slots: int, max_wait: float, max_queue: int):
+        self.slots     = max(slots, 1)
+        self.max_wait  = max_wait
+        self.max_queue = max_queue
+        self.active    = 0
+        self.waiting   = {PRIORITY_USER: 0, PRIORITY_ANON: 0}
+        self._heap     = []
+        self._seq      = itertools.count()
+        self._service_ewma = 0.0        # seconds per inference, for Retry-After hints
+
+    def retry_after(self) -> int:
+        queued = sum(self.waiting.values())
+        return max(1, math.ceil(self._service_ewma * (queued + 1) / self.slots))
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free and nobody is waiting; never queues."""
+        if self.active < self.slots and not any(self.waiting.values()):
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self, priority: int):
+        if self.active < self.slots and not any(self.waiting.values()):
+            self.active += 1
+            return
+        if sum(self.waiting.values()) >= self.max_queue:
+            raise Shed("queue_full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future))
+        self.waiting[priority] += 1
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            # On 3.12+ wait_for can time out after release() already handed
+            # this future a slot — pass it on or it leaks with no holder
+            if future.done() and not future.cancelled():
+                self.release()
+            raise Shed("queue_timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # Client went away just after being handed a slot — pass it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self.waiting[priority] -= 1
+
+    def release(self, service_time: Optional[float] = None):
+        if service_time is not None:
+            self._service_ewma = service_time if not self._service_ewma else \
+                0.8 * self._service_ewma + 0.2 * service_time
+        # Hand the slot straight to the best live waiter; timed-out ones are skipped
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+# ── Admission controller ──────────────────────────────────────────────────────
+class AdmissionController:
+    def __init__(self):
+        self.limiter   = RateLimiter()
+        self.scheduler = InferenceScheduler(INFERENCE_SLOTS, MAX_QUEUE_WAIT_S, MAX_QUEUE_LENGTH)
+        self.counters  = {
+            "admitted":           0,
+            "queued":             0,    # requests that had to wait for a slot
+            "shed_rate_limited":  0,
+            "shed_queue_full":    0,
+            "shed_queue_timeout": 0,
+            "background_run":     0,    # best-effort work (shadow inference) that got a slot
+            "background_dropped": 0,    # ... and that was skipped because of load
+        }
+        self.total_wait_s = 0.0
+
+    def check_rate(self, request: Request, current_user: Optional[User]):
+        if current_user:
+            key, rate, burst = f"user:{current_user.id}", USER_RATE_PER_MIN, USER_BURST
+        else:
+            host = request.client.host if request.client else "unknown"
+            key, rate, burst = f"ip:{host}", ANON_RATE_PER_MIN, ANON_BURST
+
+        wait = self.limiter.check(key, rate, burst)
+        if wait:
+            self.counters["shed_rate_limited"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests. Please slow down.",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+    @asynccontextmanager
+    async def slot(self, authenticated: bool):
+        priority  = PRIORITY_USER if authenticated else PRIORITY_ANON
+        scheduler = self.scheduler
+        if scheduler.active >= scheduler.slots or any(scheduler.waiting.values()):
+            self.counters["queued"] += 1
+
+        start = time.monotonic()
+        try:
+            await scheduler.acquire(priority)
+        except Shed as e:
+            self.counters[f"shed_{e.reason}"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy. Please try again shortly.",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        admitted = time.monotonic()
+        self.counters["admitted"] += 1
+        self.total_wait_s         += admitted - start
+
+        try:
+            yield
+        finally:
+            scheduler.release(time.monotonic() - admitted)
+
+    async def run_if_idle(self, func, *args) -> bool:
+        """Run best-effort inference in the threadpool only when a slot is idle.
+
+        Used for shadow traffic: it must never queue ahead of, or alongside,
+        real requests, so under any load the work is dropped instead.
+        """
+        scheduler = self.scheduler
+        if not scheduler.try_acquire():
+            self.counters["background_dropped"] += 1
+            return False
+        self.counters["background_run"] += 1
+        start = time.monotonic()
+        try:
+            await run_in_threadpool(func, *args)
+        finally:
+            scheduler.release(time.monotonic() - start)
+        return True
+
+    def metrics(self) -> dict:
+        s = self.scheduler
+        return {
+            **self.counters,
+            "in_flight":       s.active,
+            "queue_length":    sum(s.waiting.values()),
+            "queue_by_class":  {"authenticated": s.waiting[PRIORITY_USER], "anonymous": s.waiting[PRIORITY_ANON]},
+            "avg_wait_ms":     round(self.total_wait_s * 1000 / self.counters["admitted"], 2)
+                               if self.counters["admitted"] else 0.0,
+            "limits": {
+                "anon_rate_per_min": ANON_RATE_PER_MIN,
+                "user_rate_per_min": USER_RATE_PER_MIN,
+                "inference_slots":   s.slots,
+                "max_queue_wait_s":  s.max_wait,
+                "max_queue_length":  s.max_queue,
+            },
+        }
+
+
+admission = AdmissionController()
+
+
+# ── Metrics route ─────────────────────────────────────────────────────────────
+@router.get("/metrics")
+def admission_metrics():
+    return admission.metrics()
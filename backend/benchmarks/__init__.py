@@ -0,0 +1 @@
+# Load-testing and regression benchmarks for the DermAssist backend.
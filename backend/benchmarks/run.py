@@ -0,0 +1,483 @@
+"""
+End-to-end load test for the DermAssist backend.
+
+Boots the real FastAPI app (uvicorn, in-process) against a throwaway SQLite
+database, drives mixed workloads over HTTP and reports throughput and latency
+percentiles. Results can be saved as a baseline and later runs compared
+against it — the process exits non-zero when a workload regresses past the
+configured thresholds.
+
+Run from the backend/ folder:
+
+    python -m benchmarks.run                        # run + compare
+    python -m benchmarks.run --save-baseline        # record a new baseline
+    python -m benchmarks.run --workloads predict_anon,user_scans -n 500
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import numpy as np
+
+BACKEND_DIR      = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_DIR       = os.path.join(BACKEND_DIR, "uploads")
+REAL_MODEL_PATH  = os.path.join(BACKEND_DIR, "skin_cancer_model.tflite")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+BENCH_PASSWORD = "bench-password-123"
+CLASSES        = ['akiec', 'bcc', 'bkl', 'df', 'mel', 'nv', 'vasc']
+
+
+# ── Environment setup ─────────────────────────────────────────────────────────
+def prepare_environment(workdir: str) -> str:
+    """Point the app at SQLite + a scratch upload dir before `main` is imported."""
+    upload_dir = os.path.join(workdir, "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["UPLOAD_DIR"]   = upload_dir
+
+    # Load comes from one IP, so per-client rate limits would only measure 429s
+    os.environ.setdefault("ADMISSION_ANON_RATE_PER_MIN", "0")
+    os.environ.setdefault("ADMISSION_USER_RATE_PER_MIN", "0")
+
+    if os.path.exists(REAL_MODEL_PATH):
+        model_path = REAL_MODEL_PATH
+        print(f"Using real model: {model_path}")
+    else:
+        from benchmarks.stub_model import build_stub_model
+        model_path = build_stub_model(os.path.join(workdir, "stub_model.tflite"))
+        print(f"Real model not found — using generated stand-in: {model_path}")
+    os.environ["MODEL_PATH"] = model_path
+    return model_path
+
+
+def load_sample_images() -> list:
+    samples = []
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        ext = name.rsplit(".", 1)[-1].lower()
+        if ext not in ("jpg", "jpeg", "png"):
+            continue
+        with open(os.path.join(SAMPLE_DIR, name), "rb") as f:
+            content_type = "image/png" if ext == "png" else "image/jpeg"
+            samples.append((name, content_type, f.read()))
+    if not samples:
+        raise SystemExit(f"No sample images found in {SAMPLE_DIR}")
+    return samples
+
+
+# ── Server ────────────────────────────────────────────────────────────────────
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int):
+    import uvicorn
+    import main
+
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise SystemExit("Benchmark server failed to start.")
+        time.sleep(0.05)
+    return server, thread
+
+
+# ── Data seeding ──────────────────────────────────────────────────────────────
+def seed_users(count: int, history_size: int) -> list:
+    """Create `count` users with `history_size` scans each; returns usernames."""
+    from database import SessionLocal
+    from models.user import User
+    from models.images import Image
+    from models.prediciton import Prediction
+
+    rng       = random.Random(42)
+    usernames = []
+    db        = SessionLocal()
+    try:
+        # One bcrypt hash shared by every seeded user keeps seeding fast
+        template = User(full_name="", username="", email="")
+        template.set_password(BENCH_PASSWORD)
+
+        for u in range(count):
+            username = f"heavy_{u}_{uuid.uuid4().hex[:6]}"
+            user = User(
+                full_name=f"Heavy User {u}",
+                username=username,
+                email=f"{username}@bench.local",
+                password_hash=template.password_hash,
+            )
+            db.add(user)
+            db.flush()
+
+            now    = datetime.utcnow()
+            images = [
+                Image(
+                    image_name=f"seed_{i}.jpg",
+                    image_path=f"uploads/seed_{i}.jpg",
+                    image_format="image/jpeg",
+                    image_size_kb=64,
+                    user_id=user.id,
+                )
+                for i in range(history_size)
+            ]
+            db.add_all(images)
+            db.flush()
+
+            scans = []
+            for i, image in enumerate(images):
+                scores = np.random.default_rng(rng.randrange(1 << 30)).dirichlet(np.ones(len(CLASSES)))
+                label  = CLASSES[int(np.argmax(scores))]
+                scans.append(Prediction(
+                    predicted_label=label,
+                    confidence_score=round(float(scores.max()), 4),
+                    model_version="v2.0",
+                    processing_time_ms=rng.randint(20, 200),
+                    raw_output=json.dumps({c: round(float(s), 4) for c, s in zip(CLASSES, scores)}),
+                    extra_metadata=json.dumps({
+                        "risk_level":     "Low Risk",
+                        "diagnosis_name": label,
+                        "image_url":      f"/uploads/{image.image_name}",
+                    }),
+                    status="completed",
+                    created_at=now - timedelta(minutes=i),
+                    user_id=user.id,
+                    image_id=image.id,
+                ))
+            db.add_all(scans)
+            db.commit()
+            usernames.append(username)
+    finally:
+        db.close()
+    return usernames
+
+
+# ── HTTP client ───────────────────────────────────────────────────────────────
+class Client:
+    """Keep-alive HTTP client; one instance per worker thread."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.conn = None
+
+    def request(self, method: str, path: str, body: bytes = None, headers: dict = None) -> tuple:
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers or {})
+                resp = self.conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+def multipart(filename: str, content_type: str, data: bytes) -> tuple:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def login_token(client: Client, username: str) -> str:
+    status, body = client.request(
+        "POST", "/auth/login",
+        body=urlencode({"username": username, "password": BENCH_PASSWORD}).encode(),
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    if status != 200:
+        raise SystemExit(f"Could not log in seeded user {username}: {status} {body[:200]}")
+    return json.loads(body)["access_token"]
+
+
+# ── Workloads ─────────────────────────────────────────────────────────────────
+# Each workload is a function(client, ctx) -> HTTP status.
+def wl_predict_anon(client, ctx):
+    name, ctype, data = ctx["next_sample"]()
+    body, headers = multipart(name, ctype, data)
+    return client.request("POST", "/predict", body, headers)[0]
+
+
+def wl_predict_auth(client, ctx):
+    name, ctype, data = ctx["next_sample"]()
+    body, headers = multipart(name, ctype, data)
+    headers["Authorization"] = f"Bearer {random.choice(ctx['tokens'])}"
+    return client.request("POST", "/predict", body, headers)[0]
+
+
+def wl_register(client, ctx):
+    username = f"reg_{uuid.uuid4().hex[:12]}"
+    payload  = json.dumps({
+        "full_name": "Bench User",
+        "username":  username,
+        "email":     f"{username}@bench.local",
+        "password":  BENCH_PASSWORD,
+    }).encode()
+    return client.request("POST", "/auth/register", payload, {"Content-Type": "application/json"})[0]
+
+
+def wl_login(client, ctx):
+    username = random.choice(ctx["usernames"])
+    body     = urlencode({"username": username, "password": BENCH_PASSWORD}).encode()
+    return client.request(
+        "POST", "/auth/login", body, {"Content-Type": "application/x-www-form-urlencoded"}
+    )[0]
+
+
+def wl_user_scans(client, ctx):
+    headers = {"Authorization": f"Bearer {random.choice(ctx['tokens'])}"}
+    return client.request("GET", "/user/scans", headers=headers)[0]
+
+
+MIXED_WEIGHTS = [
+    (wl_predict_anon, 40),
+    (wl_predict_auth, 25),
+    (wl_user_scans,   20),
+    (wl_login,        10),
+    (wl_register,      5),
+]
+
+
+def wl_mixed(client, ctx):
+    funcs, weights = zip(*MIXED_WEIGHTS)
+    return random.choices(funcs, weights=weights)[0](client, ctx)
+
+
+WORKLOADS = {
+    "predict_anon": wl_predict_anon,
+    "predict_auth": wl_predict_auth,
+    "register":     wl_register,
+    "login":        wl_login,
+    "user_scans":   wl_user_scans,
+    "mixed":        wl_mixed,
+}
+
+
+# ── Runner ────────────────────────────────────────────────────────────────────
+def run_workload(func, ctx, port: int, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors    = 0
+    lock      = threading.Lock()
+    remaining = itertools.count()
+
+    def worker():
+        nonlocal errors
+        client = Client(port)
+        while next(remaining) < requests:
+            start = time.perf_counter()
+            try:
+                status = func(client, ctx)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - start
+            with lock:
+                if status is not None and status < 400:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - started
+
+    return summarize(latencies, errors, wall)
+
+
+def summarize(latencies: list, errors: int, wall: float) -> dict:
+    if latencies:
+        ms = np.array(latencies) * 1000.0
+        p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99])
+        worst = float(ms.max())
+    else:
+        p50 = p90 = p95 = p99 = worst = 0.0
+    return {
+        "requests":       len(latencies) + errors,
+        "errors":         errors,
+        "wall_s":         round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms":         round(float(p50), 2),
+        "p90_ms":         round(float(p90), 2),
+        "p95_ms":         round(float(p95), 2),
+        "p99_ms":         round(float(p99), 2),
+        "max_ms":         round(worst, 2),
+    }
+
+
+def print_report(results: dict):
+    header = f"{'workload':<14}{'reqs':>7}{'errs':>6}{'rps':>10}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print("\n" + header)
+    print("─" * len(header))
+    for name, r in results.items():
+        print(
+            f"{name:<14}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps']:>10.1f}"
+            f"{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}"
+        )
+    print("(latencies in ms)\n")
+
+
+# ── Baseline comparison ───────────────────────────────────────────────────────
+def compare_to_baseline(results: dict, baseline: dict, max_rps_drop: float,
+                        max_latency_rise: float, max_error_rate: float) -> list:
+    """Return a list of human-readable regression messages (empty = pass)."""
+    failures = []
+    for name, cur in results.items():
+        if cur["requests"] and cur["errors"] / cur["requests"] > max_error_rate:
+            failures.append(f"{name}: error rate {cur['errors']}/{cur['requests']} exceeds {max_error_rate:.0%}")
+
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        if base["throughput_rps"] and cur["throughput_rps"] < base["throughput_rps"] * (1 - max_rps_drop):
+            failures.append(
+                f"{name}: throughput {cur['throughput_rps']} rps < baseline "
+                f"{base['throughput_rps']} rps (allowed drop {max_rps_drop:.0%})"
+            )
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[key] and cur[key] > base[key] * (1 + max_latency_rise):
+                failures.append(
+                    f"{name}: {key} {cur[key]} > baseline {base[key]} (allowed rise {max_latency_rise:.0%})"
+                )
+    return failures
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="DermAssist backend load test / regression benchmark")
+    p.add_argument("--workloads", default=",".join(WORKLOADS),
+                   help=f"comma-separated subset of: {', '.join(WORKLOADS)}")
+    p.add_argument("-n", "--requests", type=int, default=200, help="requests per workload")
+    p.add_argument("-c", "--concurrency", type=int, default=8, help="concurrent client threads")
+    p.add_argument("--warmup", type=int, default=10, help="untimed requests per workload")
+    p.add_argument("--history-users", type=int, default=3, help="seeded users with large scan histories")
+    p.add_argument("--history-size", type=int, default=2000, help="scans per seeded user")
+    p.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON path")
+    p.add_argument("--save-baseline", action="store_true", help="write results as the new baseline")
+    p.add_argument("--max-throughput-drop", type=float, default=0.15,
+                   help="fail if throughput falls by more than this fraction (default 0.15)")
+    p.add_argument("--max-latency-rise", type=float, default=0.25,
+                   help="fail if p50/p95/p99 rise by more than this fraction (default 0.25)")
+    p.add_argument("--max-error-rate", type=float, default=0.01,
+                   help="fail if more than this fraction of requests error (default 0.01)")
+    p.add_argument("--output", help="also write this run's results to a JSON file")
+    p.add_argument("--keep-workdir", action="store_true", help="keep the temp DB/uploads for inspection")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args     = parse_args(argv)
+    selected = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    unknown  = [w for w in selected if w not in WORKLOADS]
+    if unknown:
+        raise SystemExit(f"Unknown workload(s): {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="dermassist-bench-")
+    try:
+        model_path = prepare_environment(workdir)
+        samples    = load_sample_images()
+        port       = free_port()
+        server, thread = start_server(port)
+
+        print(f"Seeding {args.history_users} users × {args.history_size} scans …")
+        usernames = seed_users(args.history_users, args.history_size)
+        setup     = Client(port)
+        tokens    = [login_token(setup, u) for u in usernames]
+
+        sample_cycle = itertools.cycle(samples)
+        sample_lock  = threading.Lock()
+
+        def next_sample():
+            with sample_lock:
+                return next(sample_cycle)
+
+        ctx = {"usernames": usernames, "tokens": tokens, "next_sample": next_sample}
+
+        results = {}
+        for name in selected:
+            func = WORKLOADS[name]
+            if args.warmup:
+                run_workload(func, ctx, port, args.warmup, min(args.concurrency, args.warmup))
+            print(f"Running {name} ({args.requests} requests, concurrency {args.concurrency}) …")
+            results[name] = run_workload(func, ctx, port, args.requests, args.concurrency)
+
+        server.should_exit = True
+        thread.join(timeout=10)
+    finally:
+        if args.keep_workdir:
+            print(f"Work dir kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+
+    run = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "model":      "real" if model_path == REAL_MODEL_PATH else "stub",
+        "config": {
+            "requests":      args.requests,
+            "concurrency":   args.concurrency,
+            "history_users": args.history_users,
+            "history_size":  args.history_size,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline} — run with --save-baseline to create one.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != run["config"] or baseline.get("model") != run["model"]:
+        print("⚠ Baseline was recorded with a different config/model; comparison may be noisy.")
+
+    failures = compare_to_baseline(
+        results, baseline, args.max_throughput_drop, args.max_latency_rise, args.max_error_rate
+    )
+    if failures:
+        print("❌ Performance regressions detected:")
+        for msg in failures:
+            print(f"   - {msg}")
+        return 1
+    print("✅ No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
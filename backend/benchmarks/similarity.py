@@ -0,0 +1,107 @@
+"""
+Benchmark for the per-user lesion embedding index (similarity.py).
+
+Seeds one user with N float16 embeddings in a throwaway SQLite database, then
+times the cold load of that user's index and top-k cosine queries against it.
+
+Run from the backend/ folder:
+
+    python -m benchmarks.similarity                       # 10k scans, 256-d
+    python -m benchmarks.similarity --scans 50000 --dim 1280 --queries 2000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+
+def seed(n: int, dim: int, batch: int = 5000) -> int:
+    from database import SessionLocal, engine
+    from models import Base
+    from models.embedding import PredictionEmbedding
+    from similarity import to_blob
+
+    Base.metadata.create_all(bind=engine)
+    rng = np.random.default_rng(0)
+    db  = SessionLocal()
+    try:
+        # Raw embedding rows only; the index never joins predictions
+        for start in range(0, n, batch):
+            vectors = rng.standard_normal((min(batch, n - start), dim)).astype(np.float32)
+            db.bulk_insert_mappings(PredictionEmbedding, [
+                {
+                    "prediction_id": start + i + 1,
+                    "user_id":       1,
+                    "model_version": "bench",
+                    "dim":           dim,
+                    "vector":        to_blob(v),
+                }
+                for i, v in enumerate(vectors)
+            ])
+            db.commit()
+    finally:
+        db.close()
+    return n
+
+
+def percentiles(samples: list) -> str:
+    ms = np.array(samples) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return f"p50 {p50:.3f} ms · p95 {p95:.3f} ms · p99 {p99:.3f} ms"
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Per-user embedding similarity benchmark")
+    p.add_argument("--scans", type=int, default=10000, help="embeddings stored for the user")
+    p.add_argument("--dim", type=int, default=256, help="embedding dimension")
+    p.add_argument("--queries", type=int, default=1000, help="top-k queries to time")
+    p.add_argument("-k", type=int, default=5)
+    args = p.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="dermassist-sim-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'sim.db')}"
+    try:
+        from database import SessionLocal
+        from similarity import EmbeddingIndex
+
+        start = time.perf_counter()
+        seed(args.scans, args.dim)
+        print(f"Seeded {args.scans} × {args.dim}-d embeddings in {time.perf_counter() - start:.1f}s "
+              f"({args.scans * args.dim * 2 / 1e6:.1f} MB as float16)")
+
+        index = EmbeddingIndex()
+        db    = SessionLocal()
+        try:
+            start = time.perf_counter()
+            index.get(db, 1, "bench")
+            print(f"Cold index load: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+            rng     = np.random.default_rng(1)
+            queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+            before  = rng.integers(1, args.scans + 1, size=args.queries)
+
+            timings = []
+            for q in queries:
+                t0 = time.perf_counter()
+                index.search(db, 1, "bench", q, args.k)
+                timings.append(time.perf_counter() - t0)
+            print(f"top-{args.k} over all scans:     {percentiles(timings)} "
+                  f"({len(timings) / sum(timings):.0f} queries/sec)")
+
+            timings = []
+            for q, b in zip(queries, before):
+                t0 = time.perf_counter()
+                index.search(db, 1, "bench", q, args.k, before_id=int(b))
+                timings.append(time.perf_counter() - t0)
+            print(f"top-{args.k} over earlier scans: {percentiles(timings)}")
+        finally:
+            db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
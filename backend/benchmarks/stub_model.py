@@ -0,0 +1,32 @@
+"""
+Tiny stand-in for skin_cancer_model.tflite.
+
+The real model is not checked in, so the benchmark generates a small model
+with the same input/output contract (1×128×128×3 float32 → 1×7 softmax).
+Absolute /predict latency will be lower than production, but the request,
+preprocessing and DB paths are exercised exactly as in production.
+"""
+import os
+
+import tensorflow as tf
+
+INPUT_SIZE  = 128
+NUM_CLASSES = 7
+
+
+def build_stub_model(path: str) -> str:
+    tf.random.set_seed(0)
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(INPUT_SIZE, INPUT_SIZE, 3)),
+        tf.keras.layers.Conv2D(8, 3, strides=4, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(32, activation="relu"),
+        tf.keras.layers.Dense(NUM_CLASSES, activation="softmax"),
+    ])
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    tflite_bytes = converter.convert()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(tflite_bytes)
+    return path
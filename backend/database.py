@@ -1,16 +1,28 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # ── MySQL Connection — no password ────────────────────────────────────────────
-DATABASE_URL = "mysql+pymysql://root:@localhost:3306/dermassist_db"
+# Override with the DATABASE_URL env var (e.g. sqlite:///bench.db for benchmarks)
+DATABASE_URL = os.getenv("DATABASE_URL", "mysql+pymysql://root:@localhost:3306/dermassist_db")
+
+# SQLite connections are shared across FastAPI's threadpool workers
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 
 engine = create_engine(
     DATABASE_URL,
     echo=False,
     pool_pre_ping=True,
+    connect_args=connect_args,
 )
 
+if DATABASE_URL.startswith("sqlite"):
+    # WAL lets a streaming reader (e.g. rescore.py) and writers share the file
+    @event.listens_for(engine, "connect")
+    def _sqlite_wal(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
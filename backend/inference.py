@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+
+# ── Label metadata ────────────────────────────────────────────────────────────
+CLASSES = ['akiec', 'bcc', 'bkl', 'df', 'mel', 'nv', 'vasc']
+
+RISK_MAP = {
+    'mel': 'High Risk',      'bcc': 'High Risk',      'akiec': 'High Risk',
+    'bkl': 'Moderate Risk',  'df':  'Moderate Risk',  'vasc':  'Moderate Risk',
+    'nv':  'Low Risk',
+}
+NAME_MAP = {
+    'mel':   'Melanoma',
+    'bcc':   'Basal Cell Carcinoma',
+    'akiec': 'Actinic Keratosis',
+    'bkl':   'Benign Keratosis',
+    'df':    'Dermatofibroma',
+    'vasc':  'Vascular Lesion',
+    'nv':    'Melanocytic Nevi',
+}
+
+
+# ── Image preprocessing ───────────────────────────────────────────────────────
+def preprocess_image(image_data: bytes) -> np.ndarray:
+    nparr = np.frombuffer(image_data, np.uint8)
+    img   = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image. Please upload a valid JPEG or PNG.")
+    img      = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img      = cv2.resize(img, (128, 128))          # TFLite model expects 128×128
+    img_arr  = img.astype('float32') / 255.0
+    return np.expand_dims(img_arr, axis=0)
+
+
+def scores_dict(output_row: np.ndarray) -> dict:
+    """Per-class scores in the shape stored in Prediction.raw_output."""
+    return {CLASSES[i]: round(float(output_row[i]), 4) for i in range(len(CLASSES))}
@@ -1,23 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import tensorflow as tf
 import numpy as np
-import cv2
+import csv
+import io
 import os
 import time
 import uuid
 import json
-from typing import Optional
+import re
+import zlib
+from urllib.parse import quote
+from itertools import islice
+from typing import Optional, Literal
 from sqlalchemy.orm import Session
 
 from database import engine, SessionLocal
 from models import Base          # ✅ FIXED: import Base from models.base
 from models.user import User
 from models.images import Image
-from models.prediciton import Prediction
+from models.prediciton import Prediction, RESCORED_STATUS
+from models.embedding import PredictionEmbedding
 import auth
 from auth import get_current_user
+import model_registry
+from model_registry import registry, MODEL_PATH, MODEL_VERSION
+import admission as admission_control
+from admission import admission
+from inference import CLASSES, RISK_MAP, NAME_MAP, preprocess_image, scores_dict
+from similarity import embedding_index, from_blob, to_blob
+from prediction_archive import iter_history, count_history, fetch_by_ids
 
 app = FastAPI(title="DermAssist AI Backend", version="2.0.0")
 
@@ -25,7 +39,7 @@ app = FastAPI(title="DermAssist AI Backend", version="2.0.0")
 Base.metadata.create_all(bind=engine)
 
 # ── Static file serving ───────────────────────────────────────────────────────
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
@@ -40,22 +54,7 @@ app.add_middleware(
 
 # ── Auth router ───────────────────────────────────────────────────────────────
 app.include_router(auth.router)
-
-# ── TFLite model loading ──────────────────────────────────────────────────────
-# ✅ FIXED: replaced tf.keras.models.load_model (wrong for .tflite)
-#           with tf.lite.Interpreter (correct for .tflite files)
-MODEL_PATH  = "skin_cancer_model.tflite"
-interpreter = None
-
-if not os.path.exists(MODEL_PATH):
-    print(f"WARNING: Model file '{MODEL_PATH}' not found.")
-else:
-    try:
-        interpreter = tf.lite.Interpreter(model_path=MODEL_PATH)
-        interpreter.allocate_tensors()
-        print("✅ TFLite model loaded successfully.")
-    except Exception as e:
-        print(f"❌ Error loading TFLite model: {e}")
+app.include_router(admission_control.router)
 
 
 # ── DB dependency ─────────────────────────────────────────────────────────────
@@ -67,16 +66,42 @@ def get_db():
         db.close()
 
 
-# ── Image preprocessing ───────────────────────────────────────────────────────
-def preprocess_image(image_data: bytes) -> np.ndarray:
-    nparr = np.frombuffer(image_data, np.uint8)
-    img   = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    if img is None:
-        raise ValueError("Could not decode image. Please upload a valid JPEG or PNG.")
-    img      = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img      = cv2.resize(img, (128, 128))          # TFLite model expects 128×128
-    img_arr  = img.astype('float32') / 255.0
-    return np.expand_dims(img_arr, axis=0)
+# ── Warm-up samples ───────────────────────────────────────────────────────────
+def sample_inputs(limit: int = 3) -> list:
+    """Preprocessed images from UPLOAD_DIR, used to warm freshly loaded models."""
+    inputs = []
+    for name in sorted(os.listdir(UPLOAD_DIR)):
+        if len(inputs) >= limit:
+            break
+        try:
+            with open(os.path.join(UPLOAD_DIR, name), "rb") as f:
+                inputs.append(preprocess_image(f.read()))
+        except (OSError, ValueError):
+            continue
+    return inputs
+
+
+# ── TFLite model loading ──────────────────────────────────────────────────────
+# Models live in the registry so new versions can be loaded, warmed and
+# swapped in at runtime (see /admin/models) without restarting workers.
+app.include_router(model_registry.router)
+registry.warmup_inputs   = sample_inputs
+registry.session_factory = SessionLocal
+
+if not os.path.exists(MODEL_PATH):
+    print(f"WARNING: Model file '{MODEL_PATH}' not found.")
+else:
+    try:
+        registry.load(MODEL_VERSION, MODEL_PATH)
+        registry.register(MODEL_VERSION, MODEL_PATH)
+        print("✅ TFLite model loaded successfully.")
+    except Exception as e:
+        print(f"❌ Error loading TFLite model: {e}")
+
+# Every worker follows the rollout state shared through the database, so
+# admin changes reach all of them, and a restarted worker catches up here
+registry.sync()
+registry.start_sync()
 
 
 # ── Root & health endpoints ───────────────────────────────────────────────────
@@ -84,68 +109,67 @@ def preprocess_image(image_data: bytes) -> np.ndarray:
 def root():
     return {
         "message":      "DermAssist AI Backend is running.",
-        "model_loaded": interpreter is not None,
+        "model_loaded": registry.active is not None,
     }
 
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "model_loaded": interpreter is not None}
+    return {
+        "status":         "ok",
+        "model_loaded":   registry.active is not None,
+        "model_version":  registry.active_version,
+    }
 
 
 # ── Predict endpoint ──────────────────────────────────────────────────────────
 @app.post("/predict")
 async def predict(
+    request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user)
 ):
-    # ✅ FIXED: check interpreter instead of model
-    if interpreter is None:
+    model, shadow_model = registry.select(current_user.id if current_user else None)
+    if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded. Please check server logs.")
     if file.content_type not in ["image/jpeg", "image/png"]:
         raise HTTPException(status_code=400, detail="Only JPEG and PNG images are accepted.")
 
+    # Rate limit before doing any work: 429 + Retry-After when the bucket is empty
+    admission.check_rate(request, current_user)
+
     contents = await file.read()
 
     try:
-        input_data = preprocess_image(contents)
+        # cv2 decode + resize is CPU work; keep it off the event loop as well
+        input_data = await run_in_threadpool(preprocess_image, contents)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     # ✅ FIXED: TFLite inference (was model.predict which only works for Keras)
-    start_time = time.time()
-    try:
-        input_details  = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
-        interpreter.set_tensor(input_details[0]['index'], input_data.astype(np.float32))
-        interpreter.invoke()
-        output_data = interpreter.get_tensor(output_details[0]['index'])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+    # Inference runs off the event loop behind the admission queue: logged-in
+    # users are served first and waiters past the max queue wait get a 503.
+    async with admission.slot(authenticated=current_user is not None):
+        start_time = time.time()
+        try:
+            output_data, embedding = await run_in_threadpool(model.predict_with_embedding, input_data)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+        processing_ms = int((time.time() - start_time) * 1000)
 
-    processing_ms = int((time.time() - start_time) * 1000)
+    # Shadow candidate runs after the response is sent and never affects it.
+    # It only takes an idle inference slot; under load the sample is dropped.
+    if shadow_model is not None:
+        background_tasks.add_task(
+            admission.run_if_idle, registry.record_shadow, shadow_model, input_data, output_data
+        )
 
-    classes    = ['akiec', 'bcc', 'bkl', 'df', 'mel', 'nv', 'vasc']
     idx        = int(np.argmax(output_data))
-    prediction = classes[idx]
+    prediction = CLASSES[idx]
     confidence = float(output_data[0][idx])
 
-    risk_map = {
-        'mel': 'High Risk',      'bcc': 'High Risk',      'akiec': 'High Risk',
-        'bkl': 'Moderate Risk',  'df':  'Moderate Risk',  'vasc':  'Moderate Risk',
-        'nv':  'Low Risk',
-    }
-    name_map = {
-        'mel':   'Melanoma',
-        'bcc':   'Basal Cell Carcinoma',
-        'akiec': 'Actinic Keratosis',
-        'bkl':   'Benign Keratosis',
-        'df':    'Dermatofibroma',
-        'vasc':  'Vascular Lesion',
-        'nv':    'Melanocytic Nevi',
-    }
-
     # ── Save scan if user is logged in ────────────────────────────────────────
     image_url = None
     if current_user:
@@ -176,15 +200,12 @@ async def predict(
             scan_record = Prediction(
                 predicted_label=prediction,
                 confidence_score=round(confidence, 4),
-                model_version="v2.0",
+                model_version=model.version,
                 processing_time_ms=processing_ms,
-                raw_output=json.dumps({
-                    classes[i]: round(float(output_data[0][i]), 4)
-                    for i in range(len(classes))
-                }),
+                raw_output=json.dumps(scores_dict(output_data[0])),
                 extra_metadata=json.dumps({
-                    "risk_level":     risk_map[prediction],
-                    "diagnosis_name": name_map[prediction],
+                    "risk_level":     RISK_MAP[prediction],
+                    "diagnosis_name": NAME_MAP[prediction],
                     "image_url":      image_url,
                 }),
                 status="completed",
@@ -192,21 +213,30 @@ async def predict(
                 image_id=image_record.id,
             )
             db.add(scan_record)
+            if embedding is not None:
+                db.flush()
+                db.add(PredictionEmbedding(
+                    prediction_id=scan_record.id,
+                    user_id=current_user.id,
+                    model_version=model.version,
+                    dim=embedding.shape[1],
+                    vector=to_blob(embedding[0]),
+                ))
             db.commit()
+            if embedding is not None:
+                embedding_index.add(current_user.id, model.version, scan_record.id, embedding[0])
         except Exception as e:
             db.rollback()
             print(f"⚠ Could not save scan to DB: {e}")
 
     return {
         "diagnosis":      prediction,
-        "diagnosis_name": name_map[prediction],
-        "risk_level":     risk_map[prediction],
+        "diagnosis_name": NAME_MAP[prediction],
+        "risk_level":     RISK_MAP[prediction],
         "confidence":     round(confidence, 4),
-        "all_scores":     {
-            classes[i]: round(float(output_data[0][i]), 4)
-            for i in range(len(classes))
-        },
-        "image_url": image_url,
+        "all_scores":     scores_dict(output_data[0]),
+        "image_url":      image_url,
+        "model_version":  model.version,
     }
 
 
@@ -219,12 +249,8 @@ def get_user_scans(
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    scans = (
-        db.query(Prediction)
-        .filter(Prediction.user_id == current_user.id)
-        .order_by(Prediction.created_at.desc())
-        .all()
-    )
+    # Reads across the hot table and archived months, newest first
+    scans = iter_history(db, current_user.id)
 
     result = []
     for scan in scans:
@@ -246,6 +272,172 @@ def get_user_scans(
     return result
 
 
+# ── Similar previous scans ────────────────────────────────────────────────────
+@app.get("/user/scans/{scan_id}/similar")
+def get_similar_scans(
+    scan_id: int,
+    k: int = Query(5, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    # Embeddings carry user_id, so ownership holds whichever tier the scan is in
+    stored = (
+        db.query(PredictionEmbedding)
+        .filter(PredictionEmbedding.prediction_id == scan_id, PredictionEmbedding.user_id == current_user.id)
+        .first()
+    )
+    if not stored:
+        if not fetch_by_ids(db, [scan_id], user_id=current_user.id):
+            raise HTTPException(status_code=404, detail="Scan not found")
+        raise HTTPException(status_code=404, detail="No embedding stored for this scan")
+
+    # Only scans taken before this one, embedded by the same model version
+    matches = embedding_index.search(
+        db, current_user.id, stored.model_version, from_blob(stored.vector), k, before_id=scan_id
+    )
+    by_id = fetch_by_ids(db, [pid for pid, _ in matches], user_id=current_user.id)
+
+    result = []
+    for pid, similarity in matches:
+        match = by_id.get(pid)
+        if match is None or match.status == RESCORED_STATUS:
+            continue
+        extra = {}
+        try:
+            extra = json.loads(match.extra_metadata) if match.extra_metadata else {}
+        except Exception:
+            pass
+        result.append({
+            "id":               match.id,
+            "similarity":       round(similarity, 4),
+            "predicted_label":  match.predicted_label,
+            "confidence_score": match.confidence_score,
+            "risk_level":       extra.get("risk_level", ""),
+            "diagnosis_name":   extra.get("diagnosis_name", match.predicted_label),
+            "image_url":        extra.get("image_url", None),
+            "created_at":       str(match.created_at),
+        })
+    return {"scan_id": scan_id, "model_version": stored.model_version, "similar": result}
+
+
+# ── Streaming history export ──────────────────────────────────────────────────
+EXPORT_BATCH_SIZE = 500
+EXPORT_FIRST_BATCH = 1          # flushed on its own so the first row arrives at once
+EXPORT_FIELDS = [
+    "id", "created_at", "predicted_label", "diagnosis_name", "risk_level",
+    "confidence_score", "model_version", "processing_time_ms", "image_url",
+]
+EXPORT_COLUMNS = EXPORT_FIELDS + [f"score_{c}" for c in CLASSES]   # CSV header
+
+
+def _export_record(row) -> dict:
+    try:
+        extra = json.loads(row.extra_metadata) if row.extra_metadata else {}
+    except Exception:
+        extra = {}
+    try:
+        scores = json.loads(row.raw_output) if row.raw_output else {}
+    except Exception:
+        scores = {}
+    return {
+        "id":                 row.id,
+        "created_at":         str(row.created_at),
+        "predicted_label":    row.predicted_label,
+        "diagnosis_name":     extra.get("diagnosis_name", row.predicted_label),
+        "risk_level":         extra.get("risk_level", ""),
+        "confidence_score":   row.confidence_score,
+        "model_version":      row.model_version,
+        "processing_time_ms": row.processing_time_ms,
+        "image_url":          extra.get("image_url", None),
+        "raw_output":         scores,
+    }
+
+
+def _export_chunks(user_id: int, fmt: str):
+    """Yield the export one DB batch at a time via server-side cursors over
+    the hot and archive tiers.
+
+    Opens its own session: the request-scoped one may be closed before the
+    response body has finished streaming.
+    """
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerow(EXPORT_COLUMNS)
+        yield buf.getvalue()
+
+    db = SessionLocal()
+    try:
+        history = iter_history(db, user_id, batch_size=EXPORT_BATCH_SIZE)
+        size    = EXPORT_FIRST_BATCH
+        while True:
+            rows = list(islice(history, size))
+            if not rows:
+                break
+            size = EXPORT_BATCH_SIZE
+            buf = io.StringIO()
+            if fmt == "csv":
+                writer = csv.writer(buf)
+                for row in rows:
+                    rec = _export_record(row)
+                    writer.writerow(
+                        [rec[f] for f in EXPORT_FIELDS]
+                        + [rec["raw_output"].get(c, "") for c in CLASSES]
+                    )
+            else:
+                for row in rows:
+                    buf.write(json.dumps(_export_record(row)))
+                    buf.write("\n")
+            yield buf.getvalue()
+    finally:
+        db.close()
+
+
+def _content_disposition(filename: str) -> str:
+    """RFC 6266 attachment header: an ASCII fallback plus the UTF-8 name.
+
+    Starlette encodes headers as latin-1, so a raw non-ASCII username would
+    fail the response, and a quote in it would break the header.
+    """
+    fallback = re.sub(r'[^A-Za-z0-9._-]', "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def _gzip_chunks(chunks):
+    # Sync-flush after every chunk so the client receives data as it is produced
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)     # wbits=31 → gzip container
+    yield compressor.flush(zlib.Z_SYNC_FLUSH)               # gzip header before any DB work
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+@app.get("/user/scans/export")
+def export_user_scans(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user),
+):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    chunks     = _export_chunks(current_user.id, format)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename   = f"dermassist_scans_{current_user.username}.{format}"
+    if gzip:
+        chunks     = _gzip_chunks(chunks)
+        media_type = "application/gzip"
+        filename  += ".gz"
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": _content_disposition(filename)},
+    )
+
+
 # ── Full user profile ─────────────────────────────────────────────────────────
 @app.get("/user/me")
 def get_full_profile(
@@ -255,11 +447,7 @@ def get_full_profile(
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    total_scans = (
-        db.query(Prediction)
-        .filter(Prediction.user_id == current_user.id)
-        .count()
-    )
+    total_scans = count_history(db, current_user.id)
 
     return {
         "id":            current_user.id,
@@ -0,0 +1,530 @@
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Optional
+
+import numpy as np
+import tensorflow as tf
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from auth import get_current_user, get_db
+from models.deployment import DeployedModel, ModelRollout
+from models.user import User
+
+# ── Config ────────────────────────────────────────────────────────────────────
+MODEL_PATH     = os.getenv("MODEL_PATH", "skin_cancer_model.tflite")
+MODEL_VERSION  = os.getenv("MODEL_VERSION", "v2.0")
+WARMUP_RUNS    = int(os.getenv("MODEL_WARMUP_RUNS", "3"))
+# How often each worker re-reads the shared rollout state (0 disables polling)
+SYNC_INTERVAL_S = float(os.getenv("MODEL_SYNC_INTERVAL_S", "5"))
+# Tensor to read lesion embeddings from: "" uses a second 2-D model output if
+# the model exports one (free), "penultimate" opts in to reading the input of
+# the last FULLY_CONNECTED op, a tensor name or index picks one explicitly, and
+# "none" disables embeddings. Reading an intermediate tensor needs TFLite's
+# debug-only preserve_all_tensors mode, which costs ~20-25% extra per inference.
+EMBEDDING_TENSOR = os.getenv("MODEL_EMBEDDING_TENSOR", "")
+
+# Ops that may sit between the penultimate layer's output and the class scores
+_PASSTHROUGH_OPS = {"SOFTMAX", "LOGISTIC", "RESHAPE", "QUANTIZE", "DEQUANTIZE"}
+
+router = APIRouter(prefix="/admin/models", tags=["models"])
+
+
+# ── A single loaded model ─────────────────────────────────────────────────────
+class ModelVersion:
+    """One loaded .tflite interpreter.
+
+    Requests keep a reference to the ModelVersion they started with, so a swap
+    in the registry never affects in-flight inferences — the old interpreter is
+    released once the last request holding it finishes.
+    """
+
+    def __init__(self, version: str, path: str):
+        self.version   = version
+        self.path      = path
+        self.loaded_at = time.time()
+        self._lock     = threading.Lock()   # TFLite interpreters are not thread-safe
+
+        self.interpreter = tf.lite.Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        self.input_details  = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+
+        self.embedding_tensor = self._find_embedding_tensor(EMBEDDING_TENSOR)
+        self._embedding_quant = (0.0, 0)
+        output_indices = {d['index'] for d in self.output_details}
+        if self.embedding_tensor is not None and self.embedding_tensor not in output_indices:
+            # Intermediate tensors are only readable after invoke() when the
+            # interpreter is told not to reuse their buffers.
+            print(f"WARNING: Reading embeddings from intermediate tensor {self.embedding_tensor} "
+                  f"of {self.path}; inference runs with preserve_all_tensors and is slower.")
+            self.interpreter = tf.lite.Interpreter(model_path=path, experimental_preserve_all_tensors=True)
+            self.interpreter.allocate_tensors()
+        if self.embedding_tensor is not None:
+            # Looked up once: get_tensor_details() rebuilds every tensor's details
+            detail = self.interpreter._get_tensor_details(self.embedding_tensor, 0)
+            self._embedding_quant = detail.get('quantization', (0.0, 0))
+
+    @property
+    def input_shape(self) -> tuple:
+        return tuple(self.input_details[0]['shape'])
+
+    def _run(self, data: np.ndarray) -> np.ndarray:
+        index = self.input_details[0]['index']
+        if tuple(self.interpreter.get_input_details()[0]['shape']) != data.shape:
+            self.interpreter.resize_tensor_input(index, list(data.shape))
+            self.interpreter.allocate_tensors()
+        self.interpreter.set_tensor(index, data.astype(np.float32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_details[0]['index']).copy()
+
+    def _find_embedding_tensor(self, spec: str) -> Optional[int]:
+        spec = spec.strip()
+        if spec.lower() == "none":
+            return None
+        if not spec:
+            # A model exporting a second 2-D output exposes its embedding directly
+            for d in self.output_details[1:]:
+                if len(d['shape']) == 2:
+                    return d['index']
+            return None
+        if spec.isdigit():
+            return int(spec)
+        if spec.lower() != "penultimate":
+            for d in self.interpreter.get_tensor_details():
+                if d['name'] == spec:
+                    return d['index']
+            print(f"WARNING: Embedding tensor '{spec}' not found in {self.path}.")
+            return None
+
+        # Opt-in: walk back from the class scores to the last FULLY_CONNECTED
+        # op; its input is the penultimate-layer activation.
+        try:
+            ops = self.interpreter._get_ops_details()
+        except AttributeError:
+            return None
+        producers = {
+            int(out): op for op in ops if op['op_name'] != 'DELEGATE' for out in op['outputs']
+        }
+        tensor = self.output_details[0]['index']
+        while tensor in producers:
+            op = producers[tensor]
+            if op['op_name'] == 'FULLY_CONNECTED':
+                return int(op['inputs'][0])
+            if op['op_name'] not in _PASSTHROUGH_OPS:
+                return None
+            tensor = int(op['inputs'][0])
+        return None
+
+    def _read_embedding(self) -> np.ndarray:
+        values = self.interpreter.get_tensor(self.embedding_tensor).astype(np.float32)
+        scale, zero_point = self._embedding_quant
+        if scale:
+            values = (values - zero_point) * scale
+        return values.reshape(values.shape[0], -1)
+
+    def predict(self, input_data: np.ndarray) -> np.ndarray:
+        with self._lock:
+            return self._run(input_data)
+
+    def predict_with_embedding(self, input_data: np.ndarray) -> tuple:
+        """Class scores plus the lesion embedding (None if the model has none)."""
+        with self._lock:
+            output = self._run(input_data)
+            if self.embedding_tensor is None:
+                return output, None
+            return output, self._read_embedding()
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        """Run N stacked inputs (N×H×W×C) in one invoke by resizing the batch dim.
+
+        Falls back to one invoke per row for models exported with a fixed batch
+        size. Meant for offline jobs that own their ModelVersion — resizing a
+        live interpreter would stall requests queued behind the lock.
+        """
+        with self._lock:
+            try:
+                return self._run(batch)
+            except (ValueError, RuntimeError):
+                return np.concatenate([self._run(row[None]) for row in batch])
+
+    def warm_up(self, inputs: Optional[list] = None, runs: int = WARMUP_RUNS):
+        if not inputs:
+            rng    = np.random.default_rng(0)
+            inputs = [rng.random(self.input_shape, dtype=np.float32) for _ in range(runs)]
+        for data in inputs[:max(runs, 1)]:
+            self.predict(data)
+
+
+# ── Registry ──────────────────────────────────────────────────────────────────
+class ModelRegistry:
+    """Holds every loaded model version plus the routing policy.
+
+    `active` serves all traffic except the `candidate_fraction` routed to the
+    candidate. In shadow mode the candidate never answers a request; it is run
+    on a copy of the input and only its agreement with `active` is recorded.
+
+    Each process has its own registry. With several workers, the admin routes
+    write the desired state to the `deployed_models` / `model_rollout` tables
+    and every worker reconciles to it in `sync()`, polled in the background.
+    """
+
+    def __init__(self):
+        self._lock    = threading.Lock()
+        self.versions: dict = {}
+        self.loading:  dict = {}            # version -> "loading" | error message
+        self.active_version:     Optional[str] = None
+        self.candidate_version:  Optional[str] = None
+        self.candidate_fraction: float = 0.0
+        self.shadow:             bool  = False
+        self.shadow_stats:       dict  = {}
+        self.warmup_inputs = None           # callable returning sample inputs
+        self.session_factory = None         # enables sync() with the shared state
+
+    # ── Loading ───────────────────────────────────────────────────────────────
+    def load(self, version: str, path: str) -> ModelVersion:
+        """Load and warm up a new version. Version names are never reused while
+        loaded, so each name always refers to the model that served it."""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model file '{path}' not found.")
+        model = ModelVersion(version, path)
+        model.warm_up(self.warmup_inputs() if self.warmup_inputs else None)
+        with self._lock:
+            if version in self.versions:
+                raise ValueError(f"Version '{version}' is already loaded; unload it first.")
+            self.versions[version] = model
+            self.loading.pop(version, None)
+            if self.active_version is None:
+                self.active_version = version
+        return model
+
+    def load_async(self, version: str, path: str, promote: bool = False,
+                   candidate_fraction: Optional[float] = None, shadow: bool = False):
+        with self._lock:
+            if version in self.versions:
+                raise ValueError(f"Version '{version}' is already loaded; unload it first.")
+            if self.loading.get(version) == "loading":
+                raise ValueError(f"Version '{version}' is already loading.")
+            self.loading[version] = "loading"
+
+        def _worker():
+            try:
+                self.load(version, path)
+                if promote:
+                    self.promote(version)
+                elif candidate_fraction is not None or shadow:
+                    self.set_candidate(version, candidate_fraction or 0.0, shadow)
+                print(f"✅ Model {version} loaded from {path}.")
+                self.sync()             # apply any routing that was waiting on this version
+            except Exception as e:
+                with self._lock:
+                    self.loading[version] = str(e)
+                print(f"❌ Error loading model {version}: {e}")
+
+        threading.Thread(target=_worker, name=f"model-load-{version}", daemon=True).start()
+
+    def unload(self, version: str):
+        with self._lock:
+            if version == self.active_version:
+                raise ValueError("Cannot unload the active model version.")
+            if version == self.candidate_version:
+                self.candidate_version  = None
+                self.candidate_fraction = 0.0
+                self.shadow             = False
+            self.versions.pop(version, None)
+            self.shadow_stats.pop(version, None)
+
+    # ── Routing policy ────────────────────────────────────────────────────────
+    def promote(self, version: str):
+        with self._lock:
+            if version not in self.versions:
+                raise KeyError(version)
+            self.active_version = version
+            if self.candidate_version == version:
+                self.candidate_version  = None
+                self.candidate_fraction = 0.0
+                self.shadow             = False
+
+    def set_candidate(self, version: Optional[str], fraction: float = 0.0, shadow: bool = False):
+        with self._lock:
+            if version is not None and version not in self.versions:
+                raise KeyError(version)
+            self.candidate_version  = version
+            self.candidate_fraction = min(max(fraction, 0.0), 1.0) if version else 0.0
+            self.shadow             = bool(shadow) and version is not None
+
+    # ── Shared state across workers ───────────────────────────────────────────
+    def register(self, version: str, path: str):
+        """Record a version loaded at startup so every worker keeps it."""
+        if self.session_factory is None:
+            return
+        db = self.session_factory()
+        try:
+            if db.get(DeployedModel, version) is None:
+                db.add(DeployedModel(version=version, path=path))
+                db.commit()
+        except IntegrityError:
+            db.rollback()               # another worker registered it first
+        finally:
+            db.close()
+
+    def sync(self):
+        """Reconcile this worker with the desired state in the database.
+
+        Loads deployed versions it is missing, applies the rollout once the
+        versions it names are ready here, and unloads versions that were
+        removed. Safe to call from any thread at any time.
+        """
+        if self.session_factory is None:
+            return
+        db = self.session_factory()
+        try:
+            deployed = {m.version: m.path for m in db.query(DeployedModel)}
+            rollout  = db.get(ModelRollout, 1)
+            desired  = rollout and (
+                rollout.active_version, rollout.candidate_version,
+                rollout.candidate_fraction or 0.0, bool(rollout.shadow),
+            )
+        finally:
+            db.close()
+
+        with self._lock:
+            loaded  = set(self.versions)
+            pending = set(self.loading)
+            # A failed load is retried only after the version is removed and re-added
+            for version in pending - set(deployed):
+                if self.loading[version] != "loading":
+                    del self.loading[version]
+        for version, path in deployed.items():
+            if version not in loaded and version not in pending:
+                try:
+                    self.load_async(version, path)
+                except ValueError:
+                    pass                # raced with another sync()
+
+        if desired:
+            active, candidate, fraction, shadow = desired
+            if active in self.versions and active != self.active_version:
+                self.promote(active)
+            if candidate is None or candidate in self.versions:
+                fraction = min(max(fraction, 0.0), 1.0) if candidate else 0.0
+                shadow   = shadow and candidate is not None
+                if (self.candidate_version, self.candidate_fraction, self.shadow) != (candidate, fraction, shadow):
+                    self.set_candidate(candidate, fraction, shadow)
+
+        for version in loaded - set(deployed):
+            if version not in (self.active_version, self.candidate_version):
+                self.unload(version)
+
+    def start_sync(self, interval: float = SYNC_INTERVAL_S):
+        if self.session_factory is None or interval <= 0:
+            return
+
+        def _poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"⚠ Model registry sync failed: {e}")
+
+        threading.Thread(target=_poll, name="model-registry-sync", daemon=True).start()
+
+    @property
+    def active(self) -> Optional[ModelVersion]:
+        return self.versions.get(self.active_version)
+
+    def select(self, user_id: Optional[int] = None) -> tuple:
+        """Pick the serving model and, in shadow mode, the shadow model.
+
+        Authenticated users are bucketed by id so each patient keeps seeing the
+        same version for the whole rollout; anonymous requests are split at random.
+        """
+        with self._lock:
+            active    = self.versions.get(self.active_version)
+            candidate = self.versions.get(self.candidate_version)
+            fraction  = self.candidate_fraction
+            shadow    = self.shadow
+
+        if candidate is None or candidate is active:
+            return active, None
+        if shadow:
+            return active, candidate
+
+        if user_id is not None:
+            bucket = (zlib.crc32(str(user_id).encode()) % 10000) / 10000.0
+        else:
+            bucket = random.random()
+        return (candidate if bucket < fraction else active), None
+
+    def record_shadow(self, candidate: ModelVersion, input_data: np.ndarray, served_output: np.ndarray):
+        start  = time.time()
+        output = candidate.predict(input_data)
+        ms     = (time.time() - start) * 1000
+        agree  = int(np.argmax(output)) == int(np.argmax(served_output))
+        with self._lock:
+            stats = self.shadow_stats.setdefault(candidate.version, {"total": 0, "agree": 0, "total_ms": 0.0})
+            stats["total"]    += 1
+            stats["agree"]    += int(agree)
+            stats["total_ms"] += ms
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "worker_pid":         os.getpid(),
+                "active_version":     self.active_version,
+                "candidate_version":  self.candidate_version,
+                "candidate_fraction": self.candidate_fraction,
+                "shadow":             self.shadow,
+                "versions": [
+                    {"version": m.version, "path": m.path, "loaded_at": m.loaded_at}
+                    for m in self.versions.values()
+                ],
+                "loading": dict(self.loading),
+                "shadow_stats": {
+                    v: {
+                        "total":          s["total"],
+                        "agreement_rate": round(s["agree"] / s["total"], 4) if s["total"] else None,
+                        "avg_ms":         round(s["total_ms"] / s["total"], 2) if s["total"] else None,
+                    }
+                    for v, s in self.shadow_stats.items()
+                },
+            }
+
+
+registry = ModelRegistry()
+
+
+# ── Schemas ───────────────────────────────────────────────────────────────────
+class LoadModelRequest(BaseModel):
+    version:            str
+    path:               str
+    promote:            bool = False
+    candidate_fraction: Optional[float] = None
+    shadow:             bool = False
+
+
+class RolloutRequest(BaseModel):
+    version:  Optional[str] = None      # None clears the candidate
+    fraction: float = 0.0
+    shadow:   bool  = False
+
+
+# ── Admin dependency ──────────────────────────────────────────────────────────
+def require_admin(current_user: User = Depends(get_current_user)) -> User:
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
+# ── Admin routes ──────────────────────────────────────────────────────────────
+# Routes change the shared desired state and then sync this worker right away;
+# the other workers follow within MODEL_SYNC_INTERVAL_S.
+def _rollout_row(db: Session) -> ModelRollout:
+    rollout = db.get(ModelRollout, 1)
+    if rollout is None:
+        # First change: start from what this worker is serving
+        rollout = ModelRollout(
+            id=1,
+            active_version=registry.active_version,
+            candidate_version=registry.candidate_version,
+            candidate_fraction=registry.candidate_fraction,
+            shadow=registry.shadow,
+        )
+        db.add(rollout)
+    return rollout
+
+
+def _desired_state(db: Session) -> dict:
+    rollout = db.get(ModelRollout, 1)
+    return {
+        "versions": {m.version: m.path for m in db.query(DeployedModel)},
+        "rollout": rollout and {
+            "active_version":     rollout.active_version,
+            "candidate_version":  rollout.candidate_version,
+            "candidate_fraction": rollout.candidate_fraction,
+            "shadow":             rollout.shadow,
+        },
+    }
+
+
+@router.get("")
+def list_models(admin: User = Depends(require_admin), db: Session = Depends(get_db)):
+    # Local view of the worker that answered, plus the state all workers converge to
+    return {**registry.status(), "desired": _desired_state(db)}
+
+
+@router.post("/load", status_code=202)
+def load_model(payload: LoadModelRequest, admin: User = Depends(require_admin), db: Session = Depends(get_db)):
+    if not os.path.exists(payload.path):
+        raise HTTPException(status_code=400, detail=f"Model file '{payload.path}' not found.")
+    if payload.version in registry.versions or db.get(DeployedModel, payload.version) is not None:
+        raise HTTPException(status_code=409, detail=f"Version '{payload.version}' is already loaded; unload it first.")
+
+    db.add(DeployedModel(version=payload.version, path=payload.path))
+    rollout = _rollout_row(db)
+    if payload.promote:
+        rollout.active_version = payload.version
+        if rollout.candidate_version == payload.version:
+            rollout.candidate_version, rollout.candidate_fraction, rollout.shadow = None, 0.0, False
+    elif payload.candidate_fraction is not None or payload.shadow:
+        rollout.candidate_version  = payload.version
+        rollout.candidate_fraction = payload.candidate_fraction or 0.0
+        rollout.shadow             = payload.shadow
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Version '{payload.version}' is already loaded; unload it first.")
+
+    registry.sync()     # starts the load here; routing applies once it is warm
+    return {"message": f"Loading model {payload.version} in the background."}
+
+
+@router.post("/{version}/promote")
+def promote_model(version: str, admin: User = Depends(require_admin), db: Session = Depends(get_db)):
+    if db.get(DeployedModel, version) is None:
+        raise HTTPException(status_code=404, detail=f"Model version '{version}' is not loaded.")
+    rollout = _rollout_row(db)
+    rollout.active_version = version
+    if rollout.candidate_version == version:
+        rollout.candidate_version, rollout.candidate_fraction, rollout.shadow = None, 0.0, False
+    db.commit()
+    registry.sync()
+    return {"message": f"Model {version} is now active.", "active_version": version}
+
+
+@router.post("/rollout")
+def set_rollout(payload: RolloutRequest, admin: User = Depends(require_admin), db: Session = Depends(get_db)):
+    if payload.version is not None and db.get(DeployedModel, payload.version) is None:
+        raise HTTPException(status_code=404, detail=f"Model version '{payload.version}' is not loaded.")
+    rollout = _rollout_row(db)
+    rollout.candidate_version  = payload.version
+    rollout.candidate_fraction = payload.fraction if payload.version else 0.0
+    rollout.shadow             = payload.shadow and payload.version is not None
+    db.commit()
+    registry.sync()
+    return {**registry.status(), "desired": _desired_state(db)}
+
+
+@router.delete("/{version}")
+def unload_model(version: str, admin: User = Depends(require_admin), db: Session = Depends(get_db)):
+    rollout = _rollout_row(db)
+    if version == rollout.active_version:
+        raise HTTPException(status_code=400, detail="Cannot unload the active model version.")
+    if rollout.candidate_version == version:
+        rollout.candidate_version, rollout.candidate_fraction, rollout.shadow = None, 0.0, False
+    deployed = db.get(DeployedModel, version)
+    if deployed is not None:
+        db.delete(deployed)
+    db.commit()
+    registry.sync()
+    return {"message": f"Model {version} unloaded."}
@@ -11,5 +11,8 @@ from models.base import Base
 from models.user import User
 from models.images import Image
 from models.prediciton import Prediction
+from models.embedding import PredictionEmbedding
+from models.archive import PredictionArchivePeriod, PredictionArchiveUser
+from models.deployment import DeployedModel, ModelRollout
 
-__all__ = ["Base", "User", "Image", "Prediction"]
\ No newline at end of file
+__all__ = ["Base", "User", "Image", "Prediction", "PredictionEmbedding", "PredictionArchivePeriod", "PredictionArchiveUser", "DeployedModel", "ModelRollout"]
\ No newline at end of file
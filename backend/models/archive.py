@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from .base import Base, ist_now
+
+class PredictionArchivePeriod(Base):
+    """Catalog of monthly prediction archives (one predictions_archive_YYYYMM table each)."""
+    __tablename__ = "prediction_archive_periods"
+
+    period = Column(String(6), primary_key=True)          # "YYYYMM"
+    table_name = Column(String(64), nullable=False)
+
+    row_count = Column(Integer)                           # NULL while the archive job is still moving rows
+    archived_at = Column(DateTime, default=ist_now, onupdate=ist_now)
+
+    def __repr__(self):
+        return f"<PredictionArchivePeriod {self.period} ({self.row_count} rows)>"
+
+
+class PredictionArchiveUser(Base):
+    """Which users have rows in which archived month, so history reads only
+    visit those months. Written when a month's archival completes."""
+    __tablename__ = "prediction_archive_users"
+
+    user_id = Column(Integer, primary_key=True)
+    period = Column(String(6), primary_key=True)
+
+    row_count = Column(Integer, nullable=False, default=0)        # excluding rescored rows
+    rescored_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PredictionArchiveUser user={self.user_id} {self.period} ({self.row_count} rows)>"
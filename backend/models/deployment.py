@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime
+from .base import Base, ist_now
+
+class DeployedModel(Base):
+    """A model version every backend worker should have loaded."""
+    __tablename__ = "deployed_models"
+
+    version = Column(String(50), primary_key=True)
+    path = Column(String(255), nullable=False)
+
+    created_at = Column(DateTime, default=ist_now)
+
+    def __repr__(self):
+        return f"<DeployedModel {self.version} ({self.path})>"
+
+
+class ModelRollout(Base):
+    """Desired routing, shared by all workers (single row, id = 1)."""
+    __tablename__ = "model_rollout"
+
+    id = Column(Integer, primary_key=True)
+
+    active_version = Column(String(50))
+    candidate_version = Column(String(50))
+    candidate_fraction = Column(Float, default=0.0)
+    shadow = Column(Boolean, default=False)
+
+    updated_at = Column(DateTime, default=ist_now, onupdate=ist_now)
+
+    def __repr__(self):
+        return f"<ModelRollout active={self.active_version} candidate={self.candidate_version}>"
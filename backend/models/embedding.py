@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, LargeBinary, Index
+from sqlalchemy.orm import relationship
+from .base import Base, ist_now
+
+class PredictionEmbedding(Base):
+    __tablename__ = "prediction_embeddings"
+
+    # One embedding per prediction
+    prediction_id = Column(Integer, ForeignKey("predictions.id"), primary_key=True)
+
+    # Denormalised so a user's index loads without touching predictions
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    model_version = Column(String(50), nullable=False)
+
+    # L2-normalised penultimate-layer activation, packed little-endian float16
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)
+
+    created_at = Column(DateTime, default=ist_now)
+
+    # Relationships
+    prediction = relationship("Prediction", back_populates="embedding")
+
+    __table_args__ = (
+        Index("ix_prediction_embeddings_user_version", "user_id", "model_version"),
+    )
+
+    def __repr__(self):
+        return f"<PredictionEmbedding {self.prediction_id} ({self.dim}d)>"
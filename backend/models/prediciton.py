@@ -9,10 +9,14 @@
 #     risk_level = Column(String, nullable=False)
 #     confidence = Column(Float, nullable=False)
 #     created_at = Column(String, default=lambda: str(get_ist_time()))
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from .base import Base, ist_now
 
+# Status of rows written by the offline re-scoring job (rescore.py). They are
+# kept for model comparison only and hidden from a user's scan history.
+RESCORED_STATUS = "rescored"
+
 class Prediction(Base):
     __tablename__ = "predictions"
 
@@ -40,6 +44,12 @@ class Prediction(Base):
     # Relationships
     user = relationship("User", back_populates="predictions")
     image = relationship("Image", back_populates="predictions")
+    embedding = relationship("PredictionEmbedding", back_populates="prediction", uselist=False, cascade="all, delete")
+
+    # History lookups are always "one user, newest first"
+    __table_args__ = (
+        Index("ix_predictions_user_created", "user_id", "created_at"),
+    )
 
     def __repr__(self):
         return f"<Prediction {self.predicted_label} ({self.confidence_score})>"
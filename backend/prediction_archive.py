@@ -0,0 +1,611 @@
+"""
+Hot/archive storage tiers for predictions.
+
+Hot tier:     the `predictions` table. On MySQL it is RANGE-partitioned by
+              month on created_at (see `ensure_mysql_partitions`), so old
+              months can be dropped as whole partitions.
+Archive tier: one `predictions_archive_YYYYMM` table per month. raw_output is
+              packed as a float16 array in CLASSES order (14 bytes instead of
+              ~100 bytes of JSON) and extra_metadata is zlib-compressed. The
+              per-period tables also serve as the SQLite-compatible fallback
+              for partitioning, since SQLite has no native partitions.
+
+History readers (`iter_history`, `count_history`, `fetch_by_ids`) read across
+both tiers, so callers never need to know where a row lives.
+
+Run from the backend/ folder:
+
+    python prediction_archive.py indexes                       # once, after upgrading
+    python prediction_archive.py partitions --months-ahead 3   # MySQL only
+    python prediction_archive.py archive --keep-months 6
+    python prediction_archive.py status
+"""
+import argparse
+import heapq
+import json
+import time
+import zlib
+from collections import namedtuple
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import (
+    Column, Integer, String, Float, DateTime, LargeBinary, MetaData, Table, Index,
+    case, select, delete, func, inspect, text,
+)
+from sqlalchemy.orm import Session
+
+from inference import CLASSES, scores_dict
+from models.archive import PredictionArchivePeriod, PredictionArchiveUser
+from models.prediciton import Prediction, RESCORED_STATUS
+
+# ── Row shape shared by both tiers ────────────────────────────────────────────
+HISTORY_FIELDS = [
+    "id", "created_at", "predicted_label", "confidence_score", "model_version",
+    "processing_time_ms", "status", "raw_output", "extra_metadata",
+]
+HistoryRow = namedtuple("HistoryRow", HISTORY_FIELDS)
+
+HOT_COLUMNS = [getattr(Prediction, f) for f in HISTORY_FIELDS]
+
+
+# ── Periods ───────────────────────────────────────────────────────────────────
+def month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def period_name(d) -> str:
+    return f"{d.year:04d}{d.month:02d}"
+
+
+def period_start(period: str) -> date:
+    return date(int(period[:4]), int(period[4:]), 1)
+
+
+def _bounds(start: date) -> tuple:
+    return datetime.combine(start, datetime.min.time()), datetime.combine(add_months(start, 1), datetime.min.time())
+
+
+# ── Archive tables ────────────────────────────────────────────────────────────
+_archive_metadata = MetaData()
+
+
+def archive_table(period: str) -> Table:
+    name = f"predictions_archive_{period}"
+    if name in _archive_metadata.tables:
+        return _archive_metadata.tables[name]
+    return Table(
+        name, _archive_metadata,
+        Column("id", Integer, primary_key=True, autoincrement=False),
+        Column("user_id", Integer, nullable=False),
+        Column("image_id", Integer),
+        Column("created_at", DateTime, nullable=False),
+        Column("predicted_label", String(120), nullable=False),
+        Column("confidence_score", Float),
+        Column("model_version", String(50)),
+        Column("processing_time_ms", Integer),
+        Column("status", String(20)),
+        Column("scores", LargeBinary),          # float16[len(CLASSES)], NaN = missing
+        Column("extra", LargeBinary),           # zlib(JSON extra_metadata)
+        Index(f"ix_{name}_user_created", "user_id", "created_at"),
+        Index(f"ix_{name}_image", "image_id"),
+    )
+
+
+def pack_scores(raw_output: Optional[str]) -> Optional[bytes]:
+    if not raw_output:
+        return None
+    try:
+        scores = json.loads(raw_output)
+    except Exception:
+        return None
+    return np.array([scores.get(c, np.nan) for c in CLASSES], dtype="<f2").tobytes()
+
+
+def unpack_scores(blob: Optional[bytes]) -> Optional[str]:
+    if not blob:
+        return None
+    values = np.frombuffer(blob, dtype="<f2").astype(np.float32)
+    return json.dumps({k: v for k, v in scores_dict(values).items() if not np.isnan(v)})
+
+
+def pack_extra(extra_metadata: Optional[str]) -> Optional[bytes]:
+    return zlib.compress(extra_metadata.encode(), 9) if extra_metadata else None
+
+
+def unpack_extra(blob: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(blob).decode() if blob else None
+
+
+def _archived_row(row) -> HistoryRow:
+    return HistoryRow(
+        id=row.id,
+        created_at=row.created_at,
+        predicted_label=row.predicted_label,
+        confidence_score=row.confidence_score,
+        model_version=row.model_version,
+        processing_time_ms=row.processing_time_ms,
+        status=row.status,
+        raw_output=unpack_scores(row.scores),
+        extra_metadata=unpack_extra(row.extra),
+    )
+
+
+def archived_periods(db: Session) -> list:
+    """Archived periods, newest first."""
+    return [
+        p.period for p in
+        db.query(PredictionArchivePeriod).order_by(PredictionArchivePeriod.period.desc())
+    ]
+
+
+UserPeriod = namedtuple("UserPeriod", ["period", "complete", "has_rows"])
+
+
+def user_periods(db: Session, user_id: int) -> list:
+    """Every archived period newest first, flagged with whether it is complete
+    and whether this user has rows there, in a single query.
+
+    Only periods still being archived can hold the user's rows without a
+    prediction_archive_users entry, or still have them in the hot table.
+    """
+    stmt = (
+        select(PredictionArchivePeriod.period, PredictionArchivePeriod.row_count, PredictionArchiveUser.user_id)
+        .outerjoin(PredictionArchiveUser, (PredictionArchiveUser.period == PredictionArchivePeriod.period)
+                   & (PredictionArchiveUser.user_id == user_id))
+        .order_by(PredictionArchivePeriod.period.desc())
+    )
+    return [
+        UserPeriod(period, row_count is not None, row_count is None or member is not None)
+        for period, row_count, member in db.execute(stmt)
+    ]
+
+
+# ── Cross-tier history reads ──────────────────────────────────────────────────
+def _newest_first(key):
+    return key.created_at, key.id
+
+
+def iter_history(db: Session, user_id: int, batch_size: int = 500, include_rescored: bool = False):
+    """Yield a user's predictions newest first across the hot and archive tiers.
+
+    Archival moves whole months, so the tiers are time-disjoint: hot rows newer
+    than the newest archive come first, then the archived months this user has
+    rows in, then anything older. A month still being archived is merged with
+    the user's hot rows dated inside it. Only one server-side cursor is open at
+    a time, which MySQL's streaming cursors need.
+    """
+    def hot(lower=None, upper=None, stream=True):
+        stmt = select(*HOT_COLUMNS).where(Prediction.user_id == user_id)
+        if not include_rescored:
+            stmt = stmt.where(Prediction.status != RESCORED_STATUS)
+        if lower is not None:
+            stmt = stmt.where(Prediction.created_at >= lower)
+        if upper is not None:
+            stmt = stmt.where(Prediction.created_at < upper)
+        stmt = stmt.order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        if not stream:
+            return [HistoryRow(*r) for r in db.execute(stmt)]
+        return (HistoryRow(*r) for r in db.execute(
+            stmt, execution_options={"stream_results": True, "yield_per": batch_size}
+        ))
+
+    def archived(period):
+        table = archive_table(period)
+        stmt  = select(table).where(table.c.user_id == user_id)
+        if not include_rescored:
+            stmt = stmt.where(table.c.status != RESCORED_STATUS)
+        stmt = stmt.order_by(table.c.created_at.desc(), table.c.id.desc())
+        return (_archived_row(r) for r in db.execute(
+            stmt, execution_options={"stream_results": True, "yield_per": batch_size}
+        ))
+
+    periods = user_periods(db, user_id)
+    if not periods:
+        yield from hot()
+        return
+
+    upper = _bounds(period_start(periods[0].period))[1]
+    yield from hot(lower=upper)
+    for p in periods:
+        lower = _bounds(period_start(p.period))[0]
+        if p.complete:
+            if p.has_rows:
+                yield from archived(p.period)
+        else:
+            # Rows are still moving out of this month (or, on MySQL, its
+            # partition is not dropped yet): equal ids come out side by side
+            previous = None
+            stragglers = hot(lower, upper, stream=False)
+            for row in heapq.merge(archived(p.period), stragglers, key=_newest_first, reverse=True):
+                if row.id != previous:
+                    yield row
+                previous = row.id
+        upper = lower
+    yield from hot(upper=upper)
+
+
+def count_history(db: Session, user_id: int, include_rescored: bool = False) -> int:
+    q = db.query(func.count(Prediction.id)).filter(Prediction.user_id == user_id)
+    if not include_rescored:
+        q = q.filter(Prediction.status != RESCORED_STATUS)
+    total = q.scalar() or 0
+
+    # Completed months: the per-user counts recorded at archive time
+    counted = PredictionArchiveUser.row_count
+    if include_rescored:
+        counted = counted + PredictionArchiveUser.rescored_count
+    total += db.execute(
+        select(func.sum(counted))
+        .join(PredictionArchivePeriod, PredictionArchivePeriod.period == PredictionArchiveUser.period)
+        .where(PredictionArchiveUser.user_id == user_id, PredictionArchivePeriod.row_count.isnot(None))
+    ).scalar() or 0
+
+    # Months still being archived have no per-user counts yet
+    for period, in db.execute(
+        select(PredictionArchivePeriod.period).where(PredictionArchivePeriod.row_count.is_(None))
+    ).all():
+        table = archive_table(period)
+        stmt  = select(func.count()).select_from(table).where(table.c.user_id == user_id)
+        if not include_rescored:
+            stmt = stmt.where(table.c.status != RESCORED_STATUS)
+        total += db.execute(stmt).scalar() or 0
+    return total
+
+
+def fetch_by_ids(db: Session, ids: list, user_id: Optional[int] = None) -> dict:
+    """Map prediction id -> HistoryRow, looking in the archive for ids not hot.
+
+    With user_id, only that user's predictions are returned.
+    """
+    hot_stmt = select(*HOT_COLUMNS).where(Prediction.id.in_(ids))
+    if user_id is not None:
+        hot_stmt = hot_stmt.where(Prediction.user_id == user_id)
+    found   = {r.id: HistoryRow(*r) for r in db.execute(hot_stmt)} if ids else {}
+    missing = [i for i in ids if i not in found]
+    if not missing:
+        periods = []
+    elif user_id is not None:
+        periods = [p.period for p in user_periods(db, user_id) if p.has_rows]
+    else:
+        periods = archived_periods(db)
+    for period in periods:
+        table = archive_table(period)
+        stmt  = select(table).where(table.c.id.in_(missing))
+        if user_id is not None:
+            stmt = stmt.where(table.c.user_id == user_id)
+        for r in db.execute(stmt):
+            found[r.id] = _archived_row(r)
+        missing = [i for i in missing if i not in found]
+        if not missing:
+            break
+    return found
+
+
+IMAGE_FIELDS = ["id", "image_id", "created_at", "predicted_label", "model_version", "status"]
+
+
+def predictions_for_images(db: Session, image_ids: list) -> list:
+    """Every prediction for the given images across both tiers, oldest first.
+
+    Includes rescored rows; callers filter on status and model_version.
+    """
+    if not image_ids:
+        return []
+    rows = db.execute(
+        select(*[getattr(Prediction, f) for f in IMAGE_FIELDS]).where(Prediction.image_id.in_(image_ids))
+    ).all()
+    for period in archived_periods(db):
+        table = archive_table(period)
+        rows += db.execute(
+            select(*[table.c[f] for f in IMAGE_FIELDS]).where(table.c.image_id.in_(image_ids))
+        ).all()
+    return sorted(rows, key=lambda r: (r.created_at, r.id))
+
+
+# ── Index migration ───────────────────────────────────────────────────────────
+def ensure_indexes(engine):
+    """Create indexes declared after a table already existed.
+
+    `create_all` only creates missing tables, so indexes added to existing
+    ones (e.g. ix_predictions_user_created, which the history readers rely
+    on) have to be added explicitly. Also builds the per-user archive index
+    for months archived before it existed. Safe to rerun on any database.
+    """
+    from database import SessionLocal
+
+    tables = [Prediction.__table__]
+    db     = SessionLocal()
+    try:
+        tables += [archive_table(period) for period in archived_periods(db)]
+        indexed = set(db.execute(select(PredictionArchiveUser.period).distinct()).scalars())
+        for entry in db.query(PredictionArchivePeriod).filter(PredictionArchivePeriod.row_count.isnot(None)):
+            if entry.period not in indexed and entry.row_count:
+                print(f"  … indexing users of archive {entry.period}")
+                _index_users(db, entry.period, archive_table(entry.period))
+        db.commit()
+    finally:
+        db.close()
+
+    existing = inspect(engine).get_table_names()
+    created  = 0
+    for table in tables:
+        if table.name not in existing:
+            continue
+        have = {ix["name"] for ix in inspect(engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in have:
+                print(f"  … creating {index.name} on {table.name}")
+                index.create(bind=engine)
+                created += 1
+    print(f"✅ Indexes up to date ({created} created).")
+
+
+# ── MySQL partition maintenance ───────────────────────────────────────────────
+def _mysql_partitions(conn) -> list:
+    return list(conn.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'predictions' "
+        "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+    )).scalars())
+
+
+def _partition_clause(start: date) -> str:
+    return f"PARTITION p{period_name(start)} VALUES LESS THAN ('{add_months(start, 1).isoformat()}')"
+
+
+def ensure_mysql_partitions(engine, months_ahead: int = 3):
+    """Partition `predictions` by month on created_at and keep future months ready.
+
+    The first run converts the table. MySQL requires the partition column in
+    every unique key, so the primary key becomes (id, created_at). Partitioned
+    InnoDB tables cannot take part in foreign keys, so the FKs from and to
+    predictions are dropped; the ORM relationships keep working without them.
+    """
+    if engine.dialect.name != "mysql":
+        raise SystemExit("Native partitioning is MySQL-only; other databases use the per-period archive tables.")
+
+    horizon = add_months(month_start(date.today()), months_ahead)
+    with engine.begin() as conn:
+        existing = _mysql_partitions(conn)
+        if not existing:
+            oldest = conn.execute(text("SELECT MIN(created_at) FROM predictions")).scalar() or date.today()
+            fks = conn.execute(text(
+                "SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+                "WHERE CONSTRAINT_SCHEMA = DATABASE() "
+                "AND (TABLE_NAME = 'predictions' OR REFERENCED_TABLE_NAME = 'predictions')"
+            )).all()
+            for table, name in fks:
+                conn.execute(text(f"ALTER TABLE `{table}` DROP FOREIGN KEY `{name}`"))
+
+            conn.execute(text("UPDATE predictions SET created_at = NOW() WHERE created_at IS NULL"))
+            conn.execute(text(
+                "ALTER TABLE predictions MODIFY created_at DATETIME NOT NULL, "
+                "DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)"
+            ))
+
+            months, m = [], month_start(oldest)
+            while m <= horizon:
+                months.append(_partition_clause(m))
+                m = add_months(m, 1)
+            conn.execute(text(
+                "ALTER TABLE predictions PARTITION BY RANGE COLUMNS(created_at) ("
+                + ", ".join(months + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]) + ")"
+            ))
+            print(f"✅ Partitioned predictions into {len(months)} monthly partitions.")
+            return
+
+        monthly = [p for p in existing if p != "pmax"]
+        m       = add_months(period_start(monthly[-1][1:]), 1) if monthly else month_start(date.today())
+        months  = []
+        while m <= horizon:
+            months.append(_partition_clause(m))
+            m = add_months(m, 1)
+        if months:
+            conn.execute(text(
+                "ALTER TABLE predictions REORGANIZE PARTITION pmax INTO ("
+                + ", ".join(months + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]) + ")"
+            ))
+        print(f"✅ Added {len(months)} monthly partition(s).")
+
+
+# ── Archival job ──────────────────────────────────────────────────────────────
+def archive_period(engine, db: Session, start: date, chunk_size: int = 2000, pause: float = 0.0) -> int:
+    """Move one month from the hot tier into its archive table; returns rows archived.
+
+    Rows are copied in id order and the copy resumes after the highest id
+    already archived, so an interrupted run can simply be restarted. The
+    catalog entry is written with the first chunk (row_count NULL = in
+    progress), so history readers see every moved row from the moment it
+    leaves the hot table.
+    """
+    period       = period_name(start)
+    table        = archive_table(period)
+    lower, upper = _bounds(start)
+    table.create(bind=engine, checkfirst=True)
+
+    partitioned = engine.dialect.name == "mysql" and f"p{period}" in _mysql_partitions(db.connection())
+    last_id     = db.execute(select(func.max(table.c.id))).scalar() or 0
+    entry       = db.get(PredictionArchivePeriod, period)
+    moved       = 0
+    while True:
+        rows = db.execute(
+            select(*HOT_COLUMNS, Prediction.user_id, Prediction.image_id)
+            .where(Prediction.created_at >= lower, Prediction.created_at < upper)
+            .where(Prediction.id > last_id)
+            .order_by(Prediction.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        if entry is None and not partitioned:
+            entry = PredictionArchivePeriod(period=period, table_name=table.name, row_count=None)
+            db.add(entry)
+        db.execute(table.insert(), [
+            {
+                "id":                 r.id,
+                "user_id":            r.user_id,
+                "image_id":           r.image_id,
+                "created_at":         r.created_at,
+                "predicted_label":    r.predicted_label,
+                "confidence_score":   r.confidence_score,
+                "model_version":      r.model_version,
+                "processing_time_ms": r.processing_time_ms,
+                "status":             r.status,
+                "scores":             pack_scores(r.raw_output),
+                "extra":              pack_extra(r.extra_metadata),
+            }
+            for r in rows
+        ])
+        if not partitioned:
+            # Copy, delete and catalog entry commit together, so each row is
+            # in exactly one tier and always reachable by the history readers
+            db.execute(delete(Prediction.__table__).where(Prediction.id.in_([r.id for r in rows])))
+        db.commit()
+        last_id = rows[-1].id
+        moved  += len(rows)
+        if pause:
+            time.sleep(pause)
+
+    row_count = db.execute(select(func.count()).select_from(table)).scalar() or 0
+    if not row_count and entry is None:
+        db.commit()
+        table.drop(bind=engine)         # month had no predictions
+        return 0
+
+    if entry is None:
+        # Partitioned copy (the hot partition stayed authoritative), or a run
+        # that died before the catalog entry was written with the first chunk
+        entry = PredictionArchivePeriod(period=period, table_name=table.name, row_count=None)
+        db.add(entry)
+        db.commit()
+    if partitioned:
+        # Cataloged before the drop (DDL commits implicitly); readers skip
+        # the duplicate ids in between
+        db.execute(text(f"ALTER TABLE predictions DROP PARTITION p{period}"))
+
+    # Per-user index and completion commit together; readers switch from
+    # scanning this month for everyone to visiting it only for its users
+    _index_users(db, period, table)
+    entry.row_count = row_count
+    db.commit()
+    return moved
+
+
+def _index_users(db: Session, period: str, table: Table):
+    rescored = func.sum(case((table.c.status == RESCORED_STATUS, 1), else_=0))
+    counts   = db.execute(
+        select(table.c.user_id, func.count(), rescored).group_by(table.c.user_id)
+    ).all()
+    db.execute(delete(PredictionArchiveUser).where(PredictionArchiveUser.period == period))
+    if counts:
+        db.execute(PredictionArchiveUser.__table__.insert(), [
+            {"user_id": user_id, "period": period,
+             "row_count": total - (rescored or 0), "rescored_count": rescored or 0}
+            for user_id, total, rescored in counts
+        ])
+
+
+def _pending_periods(engine, db: Session) -> list:
+    """Periods whose archival was interrupted: catalog entry still in progress,
+    or an archive table that never got its catalog entry."""
+    cataloged = {p.period: p.row_count for p in db.query(PredictionArchivePeriod)}
+    pending   = {period for period, count in cataloged.items() if count is None}
+    for name in inspect(engine).get_table_names():
+        period = name[len("predictions_archive_"):]
+        if name.startswith("predictions_archive_") and period.isdigit() and period not in cataloged:
+            pending.add(period)
+    return sorted(pending)
+
+
+def run_archive(engine, keep_months: int, chunk_size: int, pause: float):
+    from database import SessionLocal
+
+    cutoff = add_months(month_start(date.today()), -keep_months)
+    db     = SessionLocal()
+    try:
+        if engine.dialect.name == "mysql" and not _mysql_partitions(db.connection()):
+            raise SystemExit(
+                "predictions is not partitioned yet. Run `python prediction_archive.py partitions` first "
+                "(it also drops the foreign keys that would block moving rows)."
+            )
+
+        # Finish interrupted months first, whatever --keep-months says now
+        for period in _pending_periods(engine, db):
+            moved = archive_period(engine, db, period_start(period), chunk_size, pause)
+            print(f"  … {period}: resumed interrupted archive ({moved} more predictions moved)")
+
+        oldest = db.query(func.min(Prediction.created_at)).scalar()
+        if oldest is None or month_start(oldest) >= cutoff:
+            print(f"Nothing older than {cutoff.isoformat()} to archive.")
+            return
+
+        m = month_start(oldest)
+        while m < cutoff:
+            start = time.time()
+            moved = archive_period(engine, db, m, chunk_size, pause)
+            if moved:
+                print(f"  … {period_name(m)}: archived {moved} predictions in {time.time() - start:.1f}s")
+            m = add_months(m, 1)
+        print(f"✅ Archived everything before {cutoff.isoformat()}.")
+    finally:
+        db.close()
+
+
+def print_status(engine):
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        hot = db.query(func.count(Prediction.id)).scalar() or 0
+        print(f"Hot tier: {hot} predictions")
+        if engine.dialect.name == "mysql":
+            print(f"Partitions: {', '.join(_mysql_partitions(db.connection())) or '(not partitioned)'}")
+        for p in db.query(PredictionArchivePeriod).order_by(PredictionArchivePeriod.period):
+            count = "in progress" if p.row_count is None else f"{p.row_count} predictions"
+            print(f"Archive {p.period}: {count} in {p.table_name} (archived {p.archived_at})")
+    finally:
+        db.close()
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    from database import engine
+    from models import Base
+
+    p   = argparse.ArgumentParser(description="Prediction partitioning and archival.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    part = sub.add_parser("partitions", help="create/extend monthly MySQL partitions (also runs `indexes`)")
+    part.add_argument("--months-ahead", type=int, default=3)
+
+    sub.add_parser("indexes", help="add indexes missing from existing predictions/archive tables")
+
+    arch = sub.add_parser("archive", help="move months older than --keep-months into archive tables")
+    arch.add_argument("--keep-months", type=int, default=6, help="months kept in the hot tier")
+    arch.add_argument("--chunk-size", type=int, default=2000)
+    arch.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+
+    sub.add_parser("status", help="show hot and archived row counts")
+    args = p.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    if args.command == "partitions":
+        ensure_mysql_partitions(engine, args.months_ahead)
+        ensure_indexes(engine)
+    elif args.command == "indexes":
+        ensure_indexes(engine)
+    elif args.command == "archive":
+        run_archive(engine, args.keep_months, args.chunk_size, args.pause)
+    else:
+        print_status(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Offline bulk re-scoring of stored images with a new model version.
+
+Streams `Image` rows, decodes the files in a process pool, runs batched
+inference and bulk-inserts fresh `Prediction` rows (status "rescored") so the
+new version can be compared with what users were originally shown.
+
+Run from the backend/ folder:
+
+    python rescore.py --model new_model.tflite --version v3.0
+    python rescore.py --model new_model.tflite --version v3.0 --max-rate 50 --nice 10
+
+The job is resumable: progress is written to a checkpoint file after every
+committed chunk, and a rerun continues from the last committed image id.
+Images that already have a prediction for --version are skipped.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import select
+
+from database import SessionLocal
+from inference import CLASSES, RISK_MAP, NAME_MAP, preprocess_image, scores_dict
+from models.base import ist_now
+from models.images import Image
+from models.prediciton import Prediction, RESCORED_STATUS
+from prediction_archive import predictions_for_images
+
+
+# ── Worker-side decoding ──────────────────────────────────────────────────────
+def _init_worker(nice: int):
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+
+def decode_file(path: str):
+    """Read + preprocess one image; returns a 128×128×3 array or None."""
+    try:
+        with open(path, "rb") as f:
+            return preprocess_image(f.read())[0]
+    except (OSError, ValueError):
+        return None
+
+
+# ── Checkpoint ────────────────────────────────────────────────────────────────
+def load_checkpoint(path: str, version: str) -> dict:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        if state.get("version") != version:
+            raise SystemExit(
+                f"Checkpoint {path} belongs to version {state.get('version')!r}, not {version!r}. "
+                "Use --checkpoint to pick another file or --restart to discard it."
+            )
+        return state
+    return {
+        "version":       version,
+        "last_image_id": 0,
+        "scored":        0,
+        "skipped":       0,
+        "failed":        0,
+        "elapsed_s":     0.0,
+        "agreement":     {},        # "previous_label>new_label" -> count
+    }
+
+
+def save_checkpoint(path: str, state: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)        # atomic, so a crash never leaves half a file
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+def resolve_path(image_path: str, upload_dir: str) -> str:
+    if os.path.isabs(image_path) or os.path.exists(image_path):
+        return image_path
+    return os.path.join(upload_dir, os.path.basename(image_path))
+
+
+def previous_labels(history: list, version: str, compare_version: str = None) -> dict:
+    """Latest non-rescored label per image from another model version."""
+    labels = {}
+    for row in history:                # oldest first, so later rows overwrite earlier ones
+        if row.status == RESCORED_STATUS:
+            continue
+        if compare_version and row.model_version != compare_version:
+            continue
+        if not compare_version and row.model_version == version:
+            continue
+        labels[row.image_id] = row.predicted_label
+    return labels
+
+
+def already_scored(history: list, version: str) -> set:
+    return {
+        row.image_id for row in history
+        if row.model_version == version and row.status == RESCORED_STATUS
+    }
+
+
+def print_agreement(agreement: dict):
+    matrix = np.zeros((len(CLASSES), len(CLASSES)), dtype=np.int64)
+    for key, count in agreement.items():
+        prev, new = key.split(">")
+        matrix[CLASSES.index(prev), CLASSES.index(new)] += count
+
+    total = int(matrix.sum())
+    if not total:
+        print("No earlier predictions to compare against.")
+        return
+    print("\nAgreement matrix (rows = previous version, cols = new version):")
+    print("        " + "".join(f"{c:>7}" for c in CLASSES))
+    for i, c in enumerate(CLASSES):
+        print(f"{c:>7} " + "".join(f"{int(v):>7}" for v in matrix[i]))
+    print(f"Overall agreement: {np.trace(matrix) / total:.2%} of {total} images")
+
+
+# ── Job ───────────────────────────────────────────────────────────────────────
+def score_chunk(model, rows: list, decoded: list, version: str, prev: dict, done: set, state: dict) -> list:
+    pending = [
+        (row, arr) for row, arr in zip(rows, decoded)
+        if row.id not in done and arr is not None
+    ]
+    state["skipped"] += sum(1 for row in rows if row.id in done)
+    state["failed"]  += sum(1 for row, arr in zip(rows, decoded) if row.id not in done and arr is None)
+    if not pending:
+        return []
+
+    start   = time.time()
+    outputs = model.predict_batch(np.stack([arr for _, arr in pending]))
+    per_img = int((time.time() - start) * 1000 / len(pending))
+
+    mappings = []
+    for (row, _), output in zip(pending, outputs):
+        label = CLASSES[int(np.argmax(output))]
+        mappings.append({
+            "predicted_label":    label,
+            "confidence_score":   round(float(output.max()), 4),
+            "model_version":      version,
+            "processing_time_ms": per_img,
+            "raw_output":         json.dumps(scores_dict(output)),
+            "extra_metadata":     json.dumps({
+                "risk_level":     RISK_MAP[label],
+                "diagnosis_name": NAME_MAP[label],
+                "image_url":      f"/uploads/{row.image_name}",
+                "previous_label": prev.get(row.id),
+            }),
+            "status":     RESCORED_STATUS,
+            "created_at": ist_now(),
+            "user_id":    row.user_id,
+            "image_id":   row.id,
+        })
+        if row.id in prev:
+            key = f"{prev[row.id]}>{label}"
+            state["agreement"][key] = state["agreement"].get(key, 0) + 1
+    return mappings
+
+
+def run(args) -> dict:
+    from model_registry import ModelVersion
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    state = load_checkpoint(args.checkpoint, args.version)
+    model = ModelVersion(args.version, args.model)
+
+    read_db  = SessionLocal()
+    write_db = SessionLocal()
+    pool     = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.nice,))
+    if args.nice and hasattr(os, "nice"):
+        os.nice(args.nice)
+
+    session_start = time.time()
+    session_done  = 0
+    try:
+        while True:
+            # Keyset window: a fresh cursor per window keeps SQLite writers unblocked
+            # and lets the checkpoint resume exactly after the last committed id.
+            window = read_db.execute(
+                select(Image)
+                .where(Image.id > state["last_image_id"])
+                .order_by(Image.id)
+                .limit(args.window),
+                execution_options={"stream_results": True, "yield_per": args.batch_size},
+            )
+            seen_any = False
+            for rows in window.scalars().partitions():
+                seen_any = True
+                ids     = [row.id for row in rows]
+                paths   = [resolve_path(row.image_path, args.upload_dir) for row in rows]
+                decoded = list(pool.map(decode_file, paths, chunksize=max(1, len(paths) // (args.workers * 4))))
+
+                # Hot and archived rows alike, so archival never hides earlier labels or finished work
+                history  = predictions_for_images(write_db, ids)
+                prev     = previous_labels(history, args.version, args.compare_version)
+                done     = already_scored(history, args.version)
+                mappings = score_chunk(model, rows, decoded, args.version, prev, done, state)
+
+                if mappings and not args.dry_run:
+                    write_db.bulk_insert_mappings(Prediction, mappings)
+                    write_db.commit()
+
+                state["last_image_id"] = ids[-1]
+                state["scored"]       += len(mappings)
+                session_done          += len(rows)
+                elapsed                = time.time() - session_start
+                state_elapsed          = state["elapsed_s"] + elapsed
+                if not args.dry_run:
+                    save_checkpoint(args.checkpoint, {**state, "elapsed_s": round(state_elapsed, 2)})
+
+                rate = session_done / elapsed if elapsed else 0.0
+                print(f"  … up to image {ids[-1]}: {state['scored']} scored, "
+                      f"{state['skipped']} skipped, {state['failed']} failed — {rate:.1f} images/sec")
+
+                # Throttle: sleep until we're back under --max-rate
+                if args.max_rate:
+                    ahead = session_done / args.max_rate - elapsed
+                    if ahead > 0:
+                        time.sleep(ahead)
+                if args.limit and session_done >= args.limit:
+                    break
+            read_db.rollback()      # release the read snapshot between windows
+            if not seen_any or (args.limit and session_done >= args.limit):
+                break
+    finally:
+        pool.shutdown()
+        read_db.close()
+        write_db.close()
+
+    elapsed = time.time() - session_start
+    state["elapsed_s"] = round(state["elapsed_s"] + elapsed, 2)
+    if not args.dry_run:
+        save_checkpoint(args.checkpoint, state)
+
+    print(f"\n✅ Done: {state['scored']} scored, {state['skipped']} skipped, {state['failed']} failed.")
+    print(f"   This run: {session_done} images in {elapsed:.1f}s "
+          f"({session_done / elapsed if elapsed else 0.0:.1f} images/sec)")
+    print_agreement(state["agreement"])
+    return state
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Re-score stored images with a new model version.")
+    p.add_argument("--model", required=True, help="path to the .tflite model to score with")
+    p.add_argument("--version", required=True, help="model_version recorded on the new predictions")
+    p.add_argument("--compare-version", help="version to compare against (default: latest other version)")
+    p.add_argument("--batch-size", type=int, default=64, help="images per inference batch / DB chunk")
+    p.add_argument("--window", type=int, default=5000, help="images per streamed query window")
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                   help="decode processes (default: half the CPUs)")
+    p.add_argument("--max-rate", type=float, default=0.0, help="cap throughput in images/sec (0 = unlimited)")
+    p.add_argument("--nice", type=int, default=0, help="lower CPU priority of the job and its workers")
+    p.add_argument("--limit", type=int, default=0, help="stop after this many images (0 = all)")
+    p.add_argument("--upload-dir", default=os.getenv("UPLOAD_DIR", "uploads"))
+    p.add_argument("--checkpoint", help="checkpoint file (default: rescore_<version>.checkpoint.json)")
+    p.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    p.add_argument("--dry-run", action="store_true", help="score and report without writing anything")
+    args = p.parse_args(argv)
+    if not args.checkpoint:
+        args.checkpoint = f"rescore_{args.version}.checkpoint.json"
+    if not os.path.exists(args.model):
+        p.error(f"model file '{args.model}' not found")
+    return args
+
+
+if __name__ == "__main__":
+    run(parse_args())
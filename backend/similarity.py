@@ -0,0 +1,200 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.embedding import PredictionEmbedding
+
+# ── Config ────────────────────────────────────────────────────────────────────
+# Per-process budget for cached float32 matrices (one user at 10k × 256-d ≈ 10 MB)
+MAX_CACHE_BYTES = int(float(os.getenv("SIMILARITY_CACHE_MB", "256")) * 1024 * 1024)
+
+
+# ── Blob packing ──────────────────────────────────────────────────────────────
+def normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm   = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def to_blob(vector: np.ndarray) -> bytes:
+    """Normalise and pack as little-endian float16 (2 bytes per dimension)."""
+    return normalize(vector).astype("<f2").tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f2").astype(np.float32)
+
+
+# ── Per-user matrix ───────────────────────────────────────────────────────────
+class UserIndex:
+    """Row-normalised float32 matrix of one user's embeddings for one model version.
+
+    Rows are kept in prediction-id order, which is also chronological, so
+    "earlier scans" is a prefix of the matrix.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim     = dim
+        self.count   = 0
+        self.ids     = np.empty(capacity, dtype=np.int64)
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+
+    def extend(self, ids: np.ndarray, vectors: np.ndarray):
+        needed = self.count + len(ids)
+        if needed > len(self.ids):
+            capacity     = max(needed, 2 * len(self.ids))     # amortised doubling
+            self.ids     = np.resize(self.ids, capacity)
+            self.vectors = np.resize(self.vectors, (capacity, self.dim))
+        self.ids[self.count:needed]     = ids
+        self.vectors[self.count:needed] = vectors
+        self.count = needed
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.vectors.nbytes
+
+    def search(self, query: np.ndarray, k: int, before_id: Optional[int] = None) -> list:
+        n = self.count
+        if before_id is not None:
+            n = int(np.searchsorted(self.ids[:n], before_id))   # ids are sorted
+        if n == 0 or k <= 0:
+            return []
+
+        scores = self.vectors[:n] @ normalize(query)
+
+        k   = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+
+# ── Index cache ───────────────────────────────────────────────────────────────
+class EmbeddingIndex:
+    """LRU cache of UserIndex objects, loaded lazily from prediction_embeddings.
+
+    Bounded by the total bytes of the cached matrices rather than a user count,
+    since one heavy user can outweigh thousands of light ones.
+    """
+
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes    = 0
+        self._lock     = threading.Lock()
+        self._cache: OrderedDict = OrderedDict()      # (user_id, version) -> UserIndex
+
+    def _extend(self, key: tuple, index: UserIndex, ids: np.ndarray, vectors: np.ndarray):
+        # Caller holds the lock. An index evicted meanwhile is no longer counted.
+        before = index.nbytes
+        index.extend(ids, vectors)
+        if self._cache.get(key) is index:
+            self.nbytes += index.nbytes - before
+        self._evict()
+
+    def _evict(self):
+        # The most recently used index is always kept, even if it alone is over budget
+        while self.nbytes > self.max_bytes and len(self._cache) > 1:
+            _, index = self._cache.popitem(last=False)
+            self.nbytes -= index.nbytes
+
+    def _fetch(self, db: Session, user_id: int, version: str, after_id: int = 0,
+               dim: Optional[int] = None) -> tuple:
+        """(ids, vectors) of stored embeddings with prediction_id > after_id.
+
+        The (user_id, model_version) index also carries prediction_id, so the
+        after_id range is an index scan even for a top-up of zero rows.
+        """
+        stmt = (
+            select(PredictionEmbedding.prediction_id, PredictionEmbedding.dim, PredictionEmbedding.vector)
+            .where(PredictionEmbedding.user_id == user_id)
+            .where(PredictionEmbedding.model_version == version)
+            .where(PredictionEmbedding.prediction_id > after_id)
+            .order_by(PredictionEmbedding.prediction_id)
+        )
+        rows = db.execute(stmt).all()
+        if not rows:
+            return np.empty(0, dtype=np.int64), None
+        dim  = dim or rows[0].dim
+        rows = [r for r in rows if r.dim == dim]
+        ids  = np.fromiter((r.prediction_id for r in rows), dtype=np.int64, count=len(rows))
+        # One join + one frombuffer instead of a Python loop per vector
+        vectors = np.frombuffer(b"".join(r.vector for r in rows), dtype="<f2").reshape(len(rows), dim)
+        return ids, vectors.astype(np.float32)
+
+    def _load(self, db: Session, user_id: int, version: str) -> Optional[UserIndex]:
+        ids, vectors = self._fetch(db, user_id, version)
+        if not len(ids):
+            return None
+        index = UserIndex(vectors.shape[1], capacity=len(ids))
+        index.extend(ids, vectors)
+        return index
+
+    def _top_up(self, db: Session, user_id: int, version: str, index: UserIndex):
+        """Append rows stored since the index was loaded or last topped up.
+
+        add() only reaches the worker that served /predict, and an add() racing
+        a cold load is dropped, so every search catches up from the DB.
+        """
+        with self._lock:
+            last_id = int(index.ids[index.count - 1]) if index.count else 0
+        ids, vectors = self._fetch(db, user_id, version, after_id=last_id, dim=index.dim)
+        if not len(ids):
+            return
+        with self._lock:
+            # Another thread may have appended some of these meanwhile
+            if index.count:
+                fresh = ids > index.ids[index.count - 1]
+                ids, vectors = ids[fresh], vectors[fresh]
+            if len(ids):
+                self._extend((user_id, version), index, ids, vectors)
+
+    def get(self, db: Session, user_id: int, version: str) -> Optional[UserIndex]:
+        key = (user_id, version)
+        with self._lock:
+            index = self._cache.get(key)
+            if index is not None:
+                self._cache.move_to_end(key)
+        if index is not None:
+            self._top_up(db, user_id, version, index)
+            return index
+
+        index = self._load(db, user_id, version)
+        if index is None:
+            return None
+        with self._lock:
+            if key in self._cache:
+                index = self._cache[key]            # another thread loaded it first
+            else:
+                self._cache[key] = index
+                self.nbytes     += index.nbytes
+            self._cache.move_to_end(key)
+            self._evict()
+        return index
+
+    def add(self, user_id: int, version: str, prediction_id: int, vector: np.ndarray):
+        """Append a freshly stored embedding if that user's index is already cached."""
+        with self._lock:
+            index = self._cache.get((user_id, version))
+            if index is None:
+                return                              # loaded from the DB on first search
+            vector = normalize(vector)
+            if vector.shape[0] != index.dim or (index.count and index.ids[index.count - 1] >= prediction_id):
+                self._cache.pop((user_id, version))  # out of order — rebuild on next search
+                self.nbytes -= index.nbytes
+                return
+            self._extend((user_id, version), index, np.array([prediction_id]), vector[None])
+
+    def search(self, db: Session, user_id: int, version: str, query: np.ndarray, k: int = 5,
+               before_id: Optional[int] = None) -> list:
+        index = self.get(db, user_id, version)
+        if index is None:
+            return []
+        with self._lock:
+            return index.search(query, k, before_id=before_id)
+
+
+embedding_index = EmbeddingIndex()
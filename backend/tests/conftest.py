@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Tests import the backend modules the same way main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Throwaway resources for tests that boot the app; a file DB because the
+# TestClient talks to it from another thread
+_workdir = tempfile.mkdtemp(prefix="dermassist-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_workdir, "uploads"))
+os.environ.setdefault("MODEL_PATH", os.path.join(_workdir, "missing_model.tflite"))
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import InferenceScheduler, Shed, PRIORITY_ANON, PRIORITY_USER
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_acquire_takes_free_slot_immediately():
+    async def scenario():
+        s = InferenceScheduler(slots=2, max_wait=1, max_queue=10)
+        await s.acquire(PRIORITY_ANON)
+        await s.acquire(PRIORITY_ANON)
+        assert s.active == 2
+        s.release()
+        s.release()
+        assert s.active == 0
+    run(scenario())
+
+
+def test_release_hands_slot_to_users_before_anonymous_fifo():
+    async def scenario():
+        s     = InferenceScheduler(slots=1, max_wait=5, max_queue=10)
+        order = []
+        await s.acquire(PRIORITY_ANON)
+
+        async def waiter(name, priority):
+            await s.acquire(priority)
+            order.append(name)
+            s.release()
+
+        tasks = [
+            asyncio.create_task(waiter("anon-1", PRIORITY_ANON)),
+            asyncio.create_task(waiter("user-1", PRIORITY_USER)),
+            asyncio.create_task(waiter("anon-2", PRIORITY_ANON)),
+            asyncio.create_task(waiter("user-2", PRIORITY_USER)),
+        ]
+        await asyncio.sleep(0)
+        assert s.waiting == {PRIORITY_USER: 2, PRIORITY_ANON: 2}
+
+        s.release()
+        await asyncio.gather(*tasks)
+        assert order == ["user-1", "user-2", "anon-1", "anon-2"]
+        assert s.active == 0
+        assert s.waiting == {PRIORITY_USER: 0, PRIORITY_ANON: 0}
+    run(scenario())
+
+
+def test_queue_full_is_shed():
+    async def scenario():
+        s = InferenceScheduler(slots=1, max_wait=5, max_queue=1)
+        await s.acquire(PRIORITY_USER)
+        queued = asyncio.create_task(s.acquire(PRIORITY_USER))
+        await asyncio.sleep(0)
+        with pytest.raises(Shed) as e:
+            await s.acquire(PRIORITY_USER)
+        assert e.value.reason == "queue_full"
+        s.release()
+        await queued
+        s.release()
+        assert s.active == 0
+    run(scenario())
+
+
+def test_timed_out_waiter_is_shed_and_skipped():
+    async def scenario():
+        s = InferenceScheduler(slots=1, max_wait=0.01, max_queue=10)
+        await s.acquire(PRIORITY_USER)
+        with pytest.raises(Shed) as e:
+            await s.acquire(PRIORITY_ANON)
+        assert e.value.reason == "queue_timeout"
+        assert e.value.retry_after >= 1
+
+        s.release()                 # the dead waiter must not swallow the slot
+        assert s.active == 0
+        await s.acquire(PRIORITY_ANON)
+        assert s.active == 1
+    run(scenario())
+
+
+def test_timeout_after_handover_passes_the_slot_on(monkeypatch):
+    # Python 3.12+ wait_for can raise TimeoutError although release() has
+    # already resolved the future; reproduce that ordering deterministically.
+    async def scenario():
+        s = InferenceScheduler(slots=1, max_wait=5, max_queue=10)
+        await s.acquire(PRIORITY_USER)
+
+        async def late_wait_for(future, timeout):
+            s.release()
+            assert future.done()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(admission.asyncio, "wait_for", late_wait_for)
+        with pytest.raises(Shed):
+            await s.acquire(PRIORITY_ANON)
+        assert s.active == 0
+        assert s.waiting[PRIORITY_ANON] == 0
+    run(scenario())
+
+
+def test_cancel_after_handover_passes_the_slot_on():
+    async def scenario():
+        s = InferenceScheduler(slots=1, max_wait=5, max_queue=10)
+        await s.acquire(PRIORITY_USER)
+        first  = asyncio.create_task(s.acquire(PRIORITY_USER))
+        second = asyncio.create_task(s.acquire(PRIORITY_ANON))
+        await asyncio.sleep(0)
+
+        s.release()                 # slot handed to `first` ...
+        first.cancel()              # ... which is cancelled before it resumes
+        try:
+            await first             # 3.11 wait_for returns the result instead
+            s.release()
+        except asyncio.CancelledError:
+            pass
+        await second                # either way the slot reaches `second`
+        assert s.active == 1
+        s.release()
+        assert s.active == 0
+    run(scenario())
+
+
+def test_cancelled_waiter_before_handover_keeps_slot_accounting():
+    async def scenario():
+        s = InferenceScheduler(slots=1, max_wait=5, max_queue=10)
+        await s.acquire(PRIORITY_USER)
+        waiter = asyncio.create_task(s.acquire(PRIORITY_ANON))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert s.waiting[PRIORITY_ANON] == 0
+        s.release()
+        assert s.active == 0
+    run(scenario())
+
+
+def test_try_acquire_never_queues():
+    async def scenario():
+        s = InferenceScheduler(slots=1, max_wait=5, max_queue=10)
+        assert s.try_acquire()
+        assert not s.try_acquire()
+        waiter = asyncio.create_task(s.acquire(PRIORITY_ANON))
+        await asyncio.sleep(0)
+        s.release()                 # goes to the waiter, not to a later try_acquire
+        await waiter
+        assert not s.try_acquire()
+        s.release()
+        assert s.try_acquire()
+        s.release()
+        assert s.active == 0
+    run(scenario())
+
+
+def test_background_work_only_runs_on_an_idle_slot():
+    async def scenario():
+        controller = admission.AdmissionController()
+        controller.scheduler = InferenceScheduler(slots=1, max_wait=5, max_queue=10)
+        calls = []
+
+        assert await controller.run_if_idle(calls.append, "idle")
+        assert controller.scheduler.active == 0
+
+        async with controller.slot(authenticated=True):
+            assert not await controller.run_if_idle(calls.append, "busy")
+        assert calls == ["idle"]
+        assert controller.counters["background_run"] == 1
+        assert controller.counters["background_dropped"] == 1
+        assert controller.scheduler.active == 0
+    run(scenario())
@@ -0,0 +1,67 @@
+import gzip
+import json
+from urllib.parse import unquote
+
+import pytest
+
+pytest.importorskip("tensorflow")           # main imports the model registry
+
+from fastapi.testclient import TestClient
+
+import main
+from database import SessionLocal
+from models.prediciton import Prediction
+from models.images import Image
+from models.user import User
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+def login(client, username: str) -> dict:
+    r = client.post("/auth/register", json={
+        "full_name": "Test User",
+        "username":  username,
+        "email":     f"user{abs(hash(username))}@example.com",
+        "password":  "password123",
+    })
+    assert r.status_code in (200, 201), r.text
+    r = client.post("/auth/login", data={"username": username, "password": "password123"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def add_scan(username: str):
+    db = SessionLocal()
+    try:
+        user  = db.query(User).filter(User.username == username).one()
+        image = Image(image_name="x.png", image_path="x.png", user_id=user.id)
+        db.add(image)
+        db.flush()
+        db.add(Prediction(predicted_label="nv", confidence_score=0.9, model_version="v2.0",
+                          raw_output=json.dumps({"nv": 0.9}), user_id=user.id, image_id=image.id))
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("username", ["राहुल", 'o"brien'])
+def test_export_filename_is_header_safe(client, username):
+    headers = login(client, username)
+    add_scan(username)
+
+    for query, suffix in (("", ".ndjson"), ("?format=csv&gzip=true", ".csv.gz")):
+        r = client.get(f"/user/scans/export{query}", headers=headers)
+        assert r.status_code == 200
+
+        disposition = r.headers["content-disposition"]
+        disposition.encode("ascii")
+        fallback = disposition.split('filename="', 1)[1].split('"', 1)[0]
+        assert fallback.endswith(suffix) and '"' not in fallback
+        assert unquote(disposition.split("filename*=UTF-8''", 1)[1]) == f"dermassist_scans_{username}{suffix}"
+
+    body = client.get("/user/scans/export", headers=headers).text
+    assert [json.loads(line)["predicted_label"] for line in body.splitlines()] == ["nv"]
+    csv_lines = gzip.decompress(client.get("/user/scans/export?format=csv&gzip=true", headers=headers).content)
+    assert len(csv_lines.splitlines()) == 2
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import model_registry
+from benchmarks.stub_model import build_stub_model
+from models import Base
+from models.deployment import DeployedModel, ModelRollout
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two registries sharing one database, like two uvicorn workers."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'registry.db'}")
+    Base.metadata.create_all(bind=engine)
+    sessions = sessionmaker(bind=engine)
+    path     = build_stub_model(str(tmp_path / "model.tflite"))
+
+    registries = []
+    for _ in range(2):
+        registry = model_registry.ModelRegistry()
+        registry.session_factory = sessions
+        registry.load("v1", path)
+        registry.register("v1", path)
+        registries.append(registry)
+    yield registries, sessions, path
+    engine.dispose()
+
+
+def wait_until(condition, timeout=30.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "registry never converged"
+        time.sleep(0.05)
+
+
+def test_workers_converge_on_shared_rollout(workers):
+    (a, b), sessions, path = workers
+    db = sessions()
+    db.add(DeployedModel(version="v2", path=path))
+    db.add(ModelRollout(id=1, active_version="v2", candidate_version="v1", candidate_fraction=0.25, shadow=True))
+    db.commit()
+
+    for registry in (a, b):
+        registry.sync()
+    for registry in (a, b):
+        wait_until(lambda: registry.active_version == "v2")
+        assert (registry.candidate_version, registry.candidate_fraction, registry.shadow) == ("v1", 0.25, True)
+
+    # Removing a version unloads it everywhere once it is no longer routed to
+    rollout = db.get(ModelRollout, 1)
+    rollout.candidate_version, rollout.candidate_fraction, rollout.shadow = None, 0.0, False
+    db.delete(db.get(DeployedModel, "v1"))
+    db.commit()
+    db.close()
+    for registry in (a, b):
+        registry.sync()
+        assert set(registry.versions) == {"v2"}
+        assert registry.candidate_version is None
+
+
+def test_loading_a_loaded_version_name_is_rejected(workers):
+    (a, _), _, path = workers
+    with pytest.raises(ValueError):
+        a.load_async("v1", path)
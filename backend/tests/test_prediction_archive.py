@@ -0,0 +1,235 @@
+import json
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+import prediction_archive as pa
+from inference import CLASSES, scores_dict
+from models import Base
+from models.archive import PredictionArchivePeriod
+from models.prediciton import Prediction, RESCORED_STATUS
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'archive.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.engine = engine
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def add_prediction(db, id, created_at, user_id=1, status="completed", label="nv"):
+    db.execute(insert(Prediction.__table__).values(
+        id=id, user_id=user_id, image_id=id, created_at=created_at,
+        predicted_label=label, confidence_score=0.5, model_version="v2.0",
+        processing_time_ms=10, status=status,
+        raw_output=json.dumps({c: round(1 / len(CLASSES), 4) for c in CLASSES}),
+        extra_metadata=json.dumps({"risk_level": "Low", "image_url": f"/uploads/{id}.jpg"}),
+    ))
+    db.commit()
+
+
+def history_ids(db, user_id=1, **kwargs):
+    return [row.id for row in pa.iter_history(db, user_id, batch_size=2, **kwargs)]
+
+
+# ── Packing ───────────────────────────────────────────────────────────────────
+def test_scores_round_trip_within_float16_precision():
+    rng    = np.random.default_rng(0)
+    logits = rng.standard_normal(len(CLASSES))
+    scores = scores_dict(np.exp(logits) / np.exp(logits).sum())
+
+    blob = pa.pack_scores(json.dumps(scores))
+    assert len(blob) == 2 * len(CLASSES)
+
+    restored = json.loads(pa.unpack_scores(blob))
+    assert list(restored) == CLASSES
+    for c in CLASSES:
+        assert restored[c] == pytest.approx(scores[c], abs=1e-3)
+
+
+def test_missing_classes_stay_missing():
+    scores   = {"mel": 0.75, "nv": 0.25}
+    restored = json.loads(pa.unpack_scores(pa.pack_scores(json.dumps(scores))))
+    assert restored == {"mel": 0.75, "nv": 0.25}
+
+
+@pytest.mark.parametrize("raw", [None, "", "not json"])
+def test_unusable_scores_pack_to_none(raw):
+    assert pa.pack_scores(raw) is None
+    assert pa.unpack_scores(None) is None
+
+
+def test_extra_metadata_round_trip():
+    extra = json.dumps({"risk_level": "High", "diagnosis_name": "Melanoma", "image_url": "/uploads/x.png"})
+    assert pa.unpack_extra(pa.pack_extra(extra)) == extra
+    assert pa.pack_extra(None) is None
+    assert pa.unpack_extra(None) is None
+
+
+# ── Periods ───────────────────────────────────────────────────────────────────
+def test_add_months_crosses_years():
+    assert pa.add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert pa.add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert pa.period_start(pa.period_name(date(2025, 7, 19))) == date(2025, 7, 1)
+
+
+# ── Cross-tier reads ──────────────────────────────────────────────────────────
+def test_iter_history_merges_tiers_newest_first(db):
+    rows = {
+        1: datetime(2025, 1, 10), 2: datetime(2025, 1, 20), 3: datetime(2025, 1, 20),   # tie on created_at
+        4: datetime(2025, 2, 5),  5: datetime(2025, 2, 28),
+        6: datetime(2025, 3, 1),  7: datetime(2025, 4, 2),
+        8: datetime(2024, 12, 31),                                                      # older than any archive
+    }
+    for id, created_at in rows.items():
+        add_prediction(db, id, created_at)
+    add_prediction(db, 9, datetime(2025, 2, 10), status=RESCORED_STATUS)
+    add_prediction(db, 10, datetime(2025, 2, 11), user_id=2)
+
+    expected = [id for id, _ in sorted(rows.items(), key=lambda r: (r[1], r[0]), reverse=True)]
+    assert history_ids(db) == expected
+
+    for month in (date(2025, 1, 1), date(2025, 2, 1)):
+        pa.archive_period(db.engine, db, month, chunk_size=2)
+    assert pa.archived_periods(db) == ["202502", "202501"]
+
+    assert history_ids(db) == expected
+    assert pa.count_history(db, 1) == len(expected)
+    assert pa.count_history(db, 1, include_rescored=True) == len(expected) + 1
+    assert RESCORED_STATUS in {r.status for r in pa.iter_history(db, 1, include_rescored=True)}
+    assert history_ids(db, user_id=2) == [10]
+
+
+def test_archived_rows_read_back_like_hot_rows(db):
+    add_prediction(db, 1, datetime(2025, 1, 10))
+    hot = next(pa.iter_history(db, 1))
+    pa.archive_period(db.engine, db, date(2025, 1, 1))
+    archived = next(pa.iter_history(db, 1))
+
+    assert archived.extra_metadata == hot.extra_metadata
+    assert json.loads(archived.raw_output) == pytest.approx(json.loads(hot.raw_output), abs=1e-3)
+    assert archived._replace(raw_output=None) == hot._replace(raw_output=None)
+
+
+def test_iter_history_skips_ids_present_in_both_tiers(db):
+    # Partitioned MySQL catalogs a month just before dropping its partition
+    for id in (1, 2):
+        add_prediction(db, id, datetime(2025, 1, id))
+    table = pa.archive_table("202501")
+    table.create(bind=db.engine)
+    rows = db.execute(select(Prediction.__table__)).mappings().all()
+    db.execute(table.insert(), [
+        {**{k: r[k] for k in ("id", "user_id", "image_id", "created_at", "predicted_label",
+                              "confidence_score", "model_version", "processing_time_ms", "status")},
+         "scores": pa.pack_scores(r["raw_output"]), "extra": pa.pack_extra(r["extra_metadata"])}
+        for r in rows
+    ])
+    db.add(PredictionArchivePeriod(period="202501", table_name=table.name, row_count=None))
+    db.commit()
+
+    assert history_ids(db) == [2, 1]
+
+
+def test_fetch_by_ids_spans_tiers_and_filters_by_user(db):
+    add_prediction(db, 1, datetime(2025, 1, 10))
+    add_prediction(db, 2, datetime(2025, 1, 11), user_id=2)
+    add_prediction(db, 3, datetime(2025, 6, 1))
+    pa.archive_period(db.engine, db, date(2025, 1, 1))
+
+    assert set(pa.fetch_by_ids(db, [1, 2, 3])) == {1, 2, 3}
+    assert set(pa.fetch_by_ids(db, [1, 2, 3], user_id=1)) == {1, 3}
+    assert pa.fetch_by_ids(db, []) == {}
+
+
+# ── Archival job ──────────────────────────────────────────────────────────────
+def test_interrupted_archive_keeps_history_and_resumes(db, monkeypatch):
+    for id in range(1, 6):
+        add_prediction(db, id, datetime(2025, 1, id))
+    add_prediction(db, 6, datetime(2025, 6, 1))
+    before = history_ids(db)
+
+    def crash(_):
+        raise RuntimeError("killed")
+    monkeypatch.setattr(pa.time, "sleep", crash)
+    with pytest.raises(RuntimeError):
+        pa.archive_period(db.engine, db, date(2025, 1, 1), chunk_size=2, pause=1)
+    db.rollback()
+
+    # First chunk moved and cataloged as in progress; nothing went missing
+    assert db.get(PredictionArchivePeriod, "202501").row_count is None
+    assert history_ids(db) == before
+    assert pa.count_history(db, 1) == len(before)
+    assert pa._pending_periods(db.engine, db) == ["202501"]
+
+    monkeypatch.undo()
+    assert pa.archive_period(db.engine, db, date(2025, 1, 1), chunk_size=2) == 3
+    assert db.get(PredictionArchivePeriod, "202501").row_count == 5
+    assert pa._pending_periods(db.engine, db) == []
+    assert history_ids(db) == before
+
+
+def test_archive_table_without_catalog_entry_is_recovered(db):
+    for id in (1, 2):
+        add_prediction(db, id, datetime(2025, 1, id))
+    pa.archive_period(db.engine, db, date(2025, 1, 1))
+    db.execute(text("DELETE FROM prediction_archive_periods"))
+    db.commit()
+    assert history_ids(db) == []
+
+    assert pa._pending_periods(db.engine, db) == ["202501"]
+    pa.archive_period(db.engine, db, date(2025, 1, 1))
+    assert history_ids(db) == [2, 1]
+    assert db.get(PredictionArchivePeriod, "202501").row_count == 2
+
+
+def test_empty_month_leaves_no_table(db):
+    add_prediction(db, 1, datetime(2025, 6, 1))
+    assert pa.archive_period(db.engine, db, date(2025, 1, 1)) == 0
+    assert pa._pending_periods(db.engine, db) == []
+    assert pa.archived_periods(db) == []
+
+
+def test_predictions_for_images_spans_tiers_oldest_first(db):
+    add_prediction(db, 1, datetime(2025, 1, 10))
+    add_prediction(db, 2, datetime(2025, 6, 1))
+    pa.archive_period(db.engine, db, date(2025, 1, 1))
+    rows = pa.predictions_for_images(db, [1, 2])
+    assert [r.id for r in rows] == [1, 2]
+    assert pa.predictions_for_images(db, []) == []
+
+
+def test_history_only_visits_archived_months_the_user_has_rows_in(db):
+    from sqlalchemy import event
+
+    add_prediction(db, 1, datetime(2025, 1, 10), user_id=1)
+    add_prediction(db, 2, datetime(2025, 2, 10), user_id=2)
+    add_prediction(db, 3, datetime(2025, 6, 1), user_id=3)
+    for month in (date(2025, 1, 1), date(2025, 2, 1)):
+        pa.archive_period(db.engine, db, month)
+
+    statements = []
+    event.listen(db.engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    def archive_tables_touched(read):
+        statements.clear()
+        result = read()
+        return result, {p for p in ("202501", "202502") if any(f"predictions_archive_{p}" in s for s in statements)}
+
+    assert archive_tables_touched(lambda: history_ids(db, user_id=3)) == ([3], set())
+    assert archive_tables_touched(lambda: pa.count_history(db, 3)) == (1, set())
+    assert archive_tables_touched(lambda: pa.fetch_by_ids(db, [1, 2], user_id=3)) == ({}, set())
+    assert archive_tables_touched(lambda: history_ids(db, user_id=1)) == ([1], {"202501"})
+    assert archive_tables_touched(lambda: pa.count_history(db, 2)) == (1, set())
+
+    # Query count stays flat however many months are archived
+    statements.clear()
+    history_ids(db, user_id=3)
+    assert len(statements) <= 3